@@ -0,0 +1,290 @@
+import os
+import re
+import time
+import threading
+from playwright.sync_api import sync_playwright
+
+LOG_PAGE_TITLE = "华瑭接口集成流日志"
+SEARCH_INPUT_SELECTOR = "input.searchInput--1dPNm"
+LOGIN_IFRAME_SELECTOR = "#yonbip_login_id, iframe[name='yonbip_login_id']"
+FLOW_INPUT_SELECTOR = "label[title='集成流'] + div input"
+
+
+# 默认拦截的资源类型与 URL 规则（正则）。样式表默认放行：元素可见性判断依赖 CSS，
+# 去掉样式后下拉框等隐藏元素会被误判为可见；确认无影响后可在配置中追加 "stylesheet"
+DEFAULT_BLOCKED_TYPES = ["image", "font", "media"]
+DEFAULT_BLOCKED_PATTERNS = [
+    r"\.map(\?|$)",
+    r"google-analytics\.com|googletagmanager\.com|hm\.baidu\.com|sentry",
+]
+# 无论如何都放行的请求（数据接口）
+DEFAULT_ALLOWED_PATTERNS = [r"report/refresh"]
+
+
+class ResourcePolicy:
+    """
+    按资源类型与 URL 规则拦截抓取过程中不需要的静态资源（图片、字体、埋点、source map 等），
+    应用 JS 与 report/refresh 接口始终放行。对应配置项 resource_policy：
+    {"enabled": true, "block_types": [...], "block_patterns": [...], "allow_patterns": [...]}
+    """
+
+    def __init__(self, config: dict):
+        conf = config.get("resource_policy", {})
+        self.enabled = conf.get("enabled", True)
+        self.block_types = set(conf.get("block_types", DEFAULT_BLOCKED_TYPES))
+        self.block_patterns = [re.compile(p) for p in conf.get("block_patterns", DEFAULT_BLOCKED_PATTERNS)]
+        self.allow_patterns = [re.compile(p) for p in conf.get("allow_patterns", DEFAULT_ALLOWED_PATTERNS)]
+        self.blocked = 0
+
+    def should_block(self, request) -> bool:
+        url = request.url
+        if any(p.search(url) for p in self.allow_patterns):
+            return False
+        if request.resource_type in self.block_types:
+            return True
+        return any(p.search(url) for p in self.block_patterns)
+
+    def handle_route(self, route, request):
+        if self.should_block(request):
+            self.blocked += 1
+            route.abort()
+        else:
+            route.fallback()
+
+    def install(self, context):
+        if self.enabled:
+            context.route("**/*", self.handle_route)
+
+
+class SessionExpired(Exception):
+    """登录态失效（被踢回登录页或接口返回 401/403），需要重新登录"""
+
+
+def _wait_in_frames(page, make_locator, timeout: float = 60, slice_ms: int = 500):
+    """
+    在页面任意 frame 中等待 make_locator(frame) 可见，返回 (frame, locator)，超时返回 (None, None)。
+    每轮先对所有 frame 做即时检查，再在最新挂载的 frame（最可能是目标）上做浏览器端的条件等待，
+    新 frame 挂载后下一轮立即纳入，不再有固定的轮询休眠。
+    """
+    deadline = time.time() + timeout
+    while True:
+        frames = list(reversed(page.frames))
+        for frame in frames:
+            try:
+                loc = make_locator(frame)
+                if loc.is_visible():
+                    return frame, loc
+            except Exception:
+                # frame 在检查过程中被卸载
+                continue
+        if time.time() >= deadline:
+            return None, None
+        try:
+            loc = make_locator(frames[0])
+            loc.wait_for(state="visible", timeout=slice_ms)
+            return frames[0], loc
+        except Exception:
+            continue
+
+
+class BrowserPool:
+    """
+    长驻浏览器池：复用同一个 Chromium 进程、持久化的登录 Cookie (storage_state)
+    以及已经导航到“华瑭接口集成流日志”的页面，只有检测到会话过期时才重新登录。
+
+    注意：Playwright 同步 API 具有线程亲和性，一个 BrowserPool 只能在创建它的线程中使用。
+    同一进程内有多个 BrowserPool 并行时（调度器的多个工作线程），各自用 state_file 指定独立的登录态文件，
+    互不覆盖，也不会在会话过期时删掉别人的文件。
+    """
+
+    def __init__(self, config: dict, headless: bool = True, state_file: str = "storage_state.json"):
+        self.config = config
+        self.headless = headless
+        state_dir = config.get("state_dir", "cache")
+        self.state_path = os.path.join(state_dir, state_file)
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._page = None
+        self._frame = None
+        self.resource_policy = ResourcePolicy(config)
+
+    # ================= 生命周期 =================
+    def _ensure_browser(self):
+        if self._browser and self._browser.is_connected():
+            return
+        print("[PROGRESS] 正在启动浏览器环境...", flush=True)
+        if not self._playwright:
+            self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch(headless=self.headless)
+        self._context = None
+        self._page = None
+        self._frame = None
+
+    def _ensure_context(self):
+        self._ensure_browser()
+        if self._context:
+            return
+        if os.path.exists(self.state_path):
+            try:
+                self._context = self._browser.new_context(storage_state=self.state_path)
+                print("[PROGRESS] 已载入缓存的登录态，尝试免登录进入系统...", flush=True)
+            except Exception as e:
+                print(f"载入登录态缓存失败，将重新登录: {e}")
+        if not self._context:
+            self._context = self._browser.new_context()
+        self.resource_policy.install(self._context)
+
+    def save_state(self):
+        """把当前上下文的 Cookie / localStorage 落盘，供下一次（或下一个进程）直接复用"""
+        if not self._context:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            # 先写临时文件再原子替换，读取方（接口回放取 Cookie）不会读到写了一半的文件
+            tmp = f"{self.state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            self._context.storage_state(path=tmp)
+            os.replace(tmp, self.state_path)
+        except Exception as e:
+            print(f"保存登录态失败: {e}")
+
+    def invalidate(self, drop_state: bool = False):
+        """丢弃当前页面与上下文（保留浏览器进程），下次 acquire 时重新导航/登录"""
+        if self._context:
+            try:
+                self._context.close()
+            except Exception:
+                pass
+        self._context = None
+        self._page = None
+        self._frame = None
+        if drop_state and os.path.exists(self.state_path):
+            try:
+                os.remove(self.state_path)
+            except Exception as e:
+                print(f"清理过期登录态失败: {e}")
+
+    def close(self):
+        self.invalidate()
+        if self._browser:
+            try:
+                self._browser.close()
+            except Exception:
+                pass
+        if self._playwright:
+            try:
+                self._playwright.stop()
+            except Exception:
+                pass
+        self._browser = None
+        self._playwright = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ================= 页面获取 =================
+    def acquire(self):
+        """
+        返回 (page, active_frame, fresh)。
+        fresh 为 False 表示复用了上一次已停留在日志页的页面（筛选框可能残留上次的条件）。
+        """
+        self._ensure_context()
+        if self._page and self._frame and self._is_log_page_alive():
+            print("[PROGRESS] 复用已打开的日志页面，跳过登录与导航...", flush=True)
+            return self._page, self._frame, False
+
+        self._page = None
+        self._frame = None
+        page = self._context.new_page()
+        try:
+            self._navigate(page)
+        except Exception:
+            self._page = page  # 供调用方截图排查
+            raise
+        return self._page, self._frame, True
+
+    @property
+    def page(self):
+        return self._page
+
+    def _is_log_page_alive(self) -> bool:
+        try:
+            if self._page.is_closed() or self._frame.is_detached():
+                return False
+            if self._page.frame(name="yonbip_login_id"):
+                return False
+            flow_loc = self._frame.locator(FLOW_INPUT_SELECTOR)
+            return flow_loc.count() > 0 and flow_loc.first.is_visible()
+        except Exception:
+            return False
+
+    def _navigate(self, page):
+        # 1. 打开首页
+        url = self.config.get("url")
+        if not url:
+            raise ValueError("请在 config.json 或环境变量中配置 url")
+        # 后续均按元素条件等待，这里无需等网络完全空闲
+        page.goto(url, wait_until="domcontentloaded")
+
+        # 2. 根据页面落点判断登录态是否仍然有效
+        page.wait_for_selector(f"{SEARCH_INPUT_SELECTOR}, {LOGIN_IFRAME_SELECTOR}", state="attached", timeout=30000)
+        if page.frame(name="yonbip_login_id") or page.locator(LOGIN_IFRAME_SELECTOR).count() > 0:
+            self._login(page)
+        else:
+            print("[PROGRESS] 登录态有效，已免登录进入系统主页...", flush=True)
+
+        # 3. 进入系统主页并使用全局搜索
+        search_input = page.locator(SEARCH_INPUT_SELECTOR)
+        search_input.wait_for(state="visible", timeout=30000)
+        self.save_state()
+
+        print(f"[PROGRESS] 正在搜索‘{LOG_PAGE_TITLE}’功能...", flush=True)
+        search_input.click()
+        search_input.fill(LOG_PAGE_TITLE)
+        page.keyboard.press("Enter")
+
+        print("寻找搜索结果并点击...")
+        frame, result = _wait_in_frames(page, lambda f: f.get_by_text(LOG_PAGE_TITLE).last, timeout=60)
+        if not result:
+            raise Exception("等待60秒仍无法在任一 iframe 中找到搜索结果文本。")
+        result.click()
+
+        # 4. 进入日志系统页
+        active_frame, _ = _wait_in_frames(page, lambda f: f.locator(FLOW_INPUT_SELECTOR).first, timeout=60)
+        if not active_frame:
+            raise Exception("等待60秒仍无法在任一 iframe 中找到筛选输入框，加载超时。可能页面转圈时间过长。")
+
+        # 查询按钮可点击即说明主渲染区已完成事件绑定
+        active_frame.locator("button.button-search").wait_for(state="visible", timeout=30000)
+
+        self._page = page
+        self._frame = active_frame
+
+    def _login(self, page):
+        print("[PROGRESS] 系统登录中...", flush=True)
+
+        # 获取对应的 frame
+        login_frame = page.frame(name="yonbip_login_id")
+        if not login_frame:
+            raise Exception("无法找到名为 yonbip_login_id 的 iframe")
+
+        # 检查是否有普通登录可点击
+        try:
+            if login_frame.locator("li#toNormalLogin").is_visible():
+                login_frame.locator("li#toNormalLogin").click()
+        except Exception:
+            pass
+
+        username = self.config.get("username")
+        password = self.config.get("password")
+
+        if not username or not password:
+            raise ValueError("请在 config.json 或环境变量中配置 username 和 password")
+
+        login_frame.locator("input#username").fill(username)
+        login_frame.locator("input#password").fill(password)
+        login_frame.locator("input#submit_btn_login").click()
+        print("[PROGRESS] 登录成功，正在进入系统主页...", flush=True)
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    finished_at TEXT NOT NULL,
+    params TEXT,
+    record_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS errors (
+    row_key INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    flow TEXT,
+    status TEXT,
+    template_id TEXT,
+    created_at TEXT,
+    message TEXT,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_errors_flow_time ON errors (flow, created_at);
+CREATE INDEX IF NOT EXISTS idx_errors_time ON errors (created_at);
+CREATE INDEX IF NOT EXISTS idx_errors_status ON errors (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_errors_template ON errors (template_id, created_at);
+"""
+
+# 历史库字段 -> 日志表列名关键字
+COLUMNS = {
+    "flow": "集成流",
+    "status": "状态",
+    "template_id": "模板ID",
+    "created_at": "创建时间",
+    "message": "消息",
+    "payload": "请求报文",
+}
+# 记录巡检参数时只保留查询条件，避免把账号密码写进历史库
+PARAM_KEYS = ("start_date", "end_date", "status", "integration_flow")
+
+
+class HistoryStore:
+    """
+    巡检历史库（SQLite，默认 cache/history.db）：每次巡检清洗后的报错记录追加入库，
+    按 集成流 / 状态 / 模板 / 创建时间 建索引，重叠时间窗口的重复记录按内容摘要去重。
+    可以直接回答“T1003 上周有哪些报错”这类问题，也为摘要卡片提供趋势数据。
+    """
+
+    def __init__(self, config: dict = None, path: str = None):
+        config = config or {}
+        self.path = path or os.path.join(config.get("state_dir", "cache"), "history.db")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _row_key(values: tuple) -> int:
+        raw = json.dumps(values, ensure_ascii=False).encode("utf-8")
+        return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "little", signed=True)
+
+    def append(self, df: pd.DataFrame, config: dict) -> int:
+        """把一次巡检的最终报错清单追加入库，返回新增条数"""
+        cols = {field: next((c for c in df.columns if kw in c), None) for field, kw in COLUMNS.items()}
+        series = {}
+        for field, col in cols.items():
+            if col is None:
+                series[field] = [None] * len(df)
+            elif pd.api.types.is_datetime64_any_dtype(df[col]):
+                series[field] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+            else:
+                series[field] = df[col].astype(str).tolist()
+        params = json.dumps({k: config.get(k) for k in PARAM_KEYS}, ensure_ascii=False)
+        with self._connect() as conn:
+            run_id = conn.execute(
+                "INSERT INTO runs (finished_at, params, record_count) VALUES (?, ?, ?)",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), params, len(df))).lastrowid
+            rows = []
+            for values in zip(*(series[f] for f in COLUMNS)):
+                rows.append((self._row_key((values[0], values[1], values[3], values[4], values[5])), run_id) + values)
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO errors (row_key, run_id, flow, status, template_id, created_at, message, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return conn.total_changes - before
+
+    def query(self, flow: str = None, status: str = None, template: str = None,
+              since: str = None, until: str = None, limit: int = None) -> pd.DataFrame:
+        """按条件查询历史报错（时间倒序）；since / until 为日期或日期时间字符串，until 为日期时包含当天"""
+        where, args = [], []
+        for column, value in (("flow", flow), ("status", status), ("template_id", template)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(str(value))
+        if since:
+            where.append("created_at >= ?")
+            args.append(str(since))
+        if until:
+            where.append("created_at <= ?")
+            args.append(str(until) + (" 23:59:59" if len(str(until)) == 10 else ""))
+        sql = "SELECT flow, status, template_id, created_at, message, payload FROM errors"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._connect() as conn:
+            return pd.read_sql_query(sql, conn, params=args)
+
+    def daily_counts(self, days: int = 7, flow: str = None) -> dict:
+        """最近 days 天（含今天）每天的报错条数，没有记录的日期为 0"""
+        first = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        sql = "SELECT substr(created_at, 1, 10) AS day, COUNT(*) FROM errors WHERE created_at >= ?"
+        args = [first]
+        if flow is not None:
+            sql += " AND flow = ?"
+            args.append(flow)
+        sql += " GROUP BY day"
+        with self._connect() as conn:
+            counts = dict(conn.execute(sql, args).fetchall())
+        return {d: counts.get(d, 0) for d in
+                ((datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days - 1, -1, -1))}
+
+    def trend_line(self, days: int = 7) -> str:
+        counts = self.daily_counts(days)
+        if not any(counts.values()):
+            return ""
+        return f"📈 近 {days} 日报错趋势：" + " | ".join(f"{d[5:]} {n}" for d, n in counts.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查询巡检历史库中的报错记录")
+    parser.add_argument("--db", default=os.path.join("cache", "history.db"), help="历史库路径")
+    parser.add_argument("--flow", help="集成流名称（完整匹配）")
+    parser.add_argument("--status", help="状态值")
+    parser.add_argument("--template", help="模板 ID，如 T00012")
+    parser.add_argument("--since", help="开始日期，如 2026-02-20")
+    parser.add_argument("--until", help="结束日期（含当天）")
+    parser.add_argument("--limit", type=int, default=50, help="最多显示条数，默认 50")
+    parser.add_argument("--trend", type=int, metavar="DAYS", help="只输出最近 DAYS 天的每日报错条数")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(path=args.db)
+    started = time.perf_counter()
+    if args.trend:
+        for day, count in store.daily_counts(args.trend, args.flow).items():
+            print(f"{day}\t{count}")
+    else:
+        df = store.query(args.flow, args.status, args.template, args.since, args.until, args.limit)
+        with pd.option_context("display.max_colwidth", 60, "display.width", 200):
+            print(df.drop(columns=["payload"]).to_string(index=False) if not df.empty else "没有符合条件的记录")
+    print(f"\n查询耗时 {(time.perf_counter() - started) * 1000:.1f}ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
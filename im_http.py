@@ -0,0 +1,36 @@
+import asyncio
+import functools
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def build_session(config: dict) -> requests.Session:
+    """
+    飞书 / 企微接口共用的 HTTP 会话：连接池 + keep-alive，连续推送几十条进度时复用同一条 TCP/TLS 连接，
+    不再每条消息重新握手。仅对“连接建立失败”（请求尚未发出）自动重试，发送消息等非幂等请求不会被重复投递。
+    对应配置项 im_http：{"pool_size": 10, "connect_timeout": 5, "timeout": 15, "upload_timeout": 120}
+    """
+    conf = config.get("im_http", {})
+    pool_size = int(conf.get("pool_size", 10))
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def timeouts(config: dict):
+    """返回 (普通请求超时, 文件上传超时)，均为 requests 的 (连接, 读取) 二元组"""
+    conf = config.get("im_http", {})
+    connect = float(conf.get("connect_timeout", 5))
+    return (connect, float(conf.get("timeout", 15))), (connect, float(conf.get("upload_timeout", 120)))
+
+
+def to_async(method):
+    """把同步的接口方法包装成协程（在线程池中执行），供 FastAPI 的 async 处理函数 await，不阻塞事件循环"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await asyncio.to_thread(method, self, *args, **kwargs)
+    return wrapper
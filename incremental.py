@@ -0,0 +1,107 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+from report_api import find_best_cells, header_name, cell_text
+
+TIME_COLUMN = "创建时间"
+FLOW_COLUMN = "集成流"
+
+
+class IncrementalStore:
+    """
+    增量巡检状态：按 (集成流, 状态) 记录已抓取到的最新“创建时间”（高水位）以及此前抓到的数据行。
+    下一次巡检只查询高水位之后的数据，再与缓存行合并，避免每次重新下载整天的日志。
+    每个键一个 gzip 压缩的 JSON 文件，保存在 cache/incremental/ 下。
+    """
+
+    def __init__(self, config: dict):
+        self.dir = os.path.join(config.get("state_dir", "cache"), "incremental")
+
+    @staticmethod
+    def _key(config: dict) -> str:
+        raw = json.dumps([config.get("integration_flow", "所有"), str(config.get("status", "2"))], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, config: dict) -> str:
+        return os.path.join(self.dir, f"{self._key(config)}.json.gz")
+
+    def load(self, config: dict):
+        try:
+            with gzip.open(self._path(config), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, config: dict, header: list, rows: list):
+        """按本次请求的开始日期保存数据行与高水位；未指定开始日期时无法界定覆盖范围，不保存"""
+        if not config.get("start_date"):
+            return
+        start = str(config.get("start_date"))[:10]
+        time_idx = _column_index(header, TIME_COLUMN)
+        if time_idx is None:
+            return
+        kept = [r for r in rows if _row_time(r, time_idx) >= start]
+        times = [_row_time(r, time_idx) for r in kept]
+        state = {
+            "covered_from": start,
+            "mark": max(times) if times else None,
+            "header": header,
+            "rows": kept,
+        }
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            tmp = f"{self._path(config)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, self._path(config))
+        except OSError as e:
+            print(f"保存增量巡检状态失败: {e}")
+
+    def narrow(self, config: dict, with_time: bool):
+        """
+        若已有覆盖本次开始日期的状态，返回 (收窄后的查询配置, 高水位之前的缓存行, 表头)；否则返回 None。
+        with_time 表示接口能否接受带时间的日期（否则只能收窄到高水位所在的那一天）。
+        """
+        start, end = config.get("start_date"), config.get("end_date")
+        if not start:
+            return None
+        state = self.load(config)
+        if not state or not state.get("mark") or state.get("covered_from", "9999") > str(start)[:10]:
+            return None
+        mark = state["mark"]
+        if mark[:10] < str(start)[:10] or (end and str(end)[:10] < mark[:10]):
+            return None
+
+        new_start = mark if with_time and len(mark) > 10 else mark[:10]
+        if new_start <= str(start):
+            # 只能按天收窄且高水位就在开始日期当天，收窄没有意义
+            return None
+        time_idx = _column_index(state["header"], TIME_COLUMN)
+        # 高水位之后（含）的数据重新获取，以拿到状态更新后的记录
+        cached = [r for r in state["rows"]
+                  if str(start)[:10] <= _row_time(r, time_idx) < new_start]
+        return dict(config, start_date=new_start), cached, state["header"]
+
+
+def _column_index(header: list, keyword: str):
+    return next((i for i, c in enumerate(header) if keyword in header_name(c)), None)
+
+
+def _row_time(row: list, idx: int) -> str:
+    return cell_text(row[idx]) if idx is not None and idx < len(row) else ""
+
+
+def rows_for_flow(payload: dict, flow: str):
+    """取出合并结果中属于某个集成流的数据行（“所有”即全部），返回 (表头, 数据行)"""
+    cells = find_best_cells(payload)
+    if not cells:
+        return [], []
+    header, rows = cells[0], cells[1:]
+    if flow == "所有":
+        return header, rows
+    flow_idx = _column_index(header, FLOW_COLUMN)
+    if flow_idx is None:
+        return header, rows
+    return header, [r for r in rows if flow_idx < len(r) and cell_text(r[flow_idx]) == flow]
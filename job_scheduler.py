@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import shutil
+import queue
+import itertools
+import threading
+import main
+from browser_pool import BrowserPool
+from progress import capture_output
+
+
+class QueueFull(Exception):
+    """排队任务已达上限，或同一用户已有未完成的任务"""
+
+
+# 合并相同请求时参与比较的查询条件及其缺省值（与 main.load_config 的默认行为一致）
+QUERY_DEFAULTS = {"start_date": None, "end_date": None, "status": "2", "integration_flow": "所有"}
+
+
+def coalesce_key(params: dict) -> str:
+    """把 DYNAMIC_PARAMS 规范化为合并键：补齐缺省值、统一转为字符串，键顺序无关"""
+    merged = dict(QUERY_DEFAULTS, **{k: v for k, v in (params or {}).items() if v is not None})
+    return json.dumps({k: "" if v is None else str(v) for k, v in merged.items()},
+                      ensure_ascii=False, sort_keys=True)
+
+
+class Subscriber:
+    """任务的一个订阅方（发起人或后来合并进来的请求人）及其回调"""
+
+    def __init__(self, requester: str = None, on_line=None, on_start=None, on_done=None):
+        self.requester = requester
+        self.on_line = on_line
+        self.on_start = on_start
+        self.on_done = on_done
+        # 合并进执行中任务的订阅方在补发完开始通知与已有进度之前，新产生的行先暂存在这里（None 表示已直连）
+        self.pending = None
+        self.done_deferred = False
+
+
+class InspectionJob:
+    """
+    一次排队中的巡检任务；回调均在工作线程中执行。
+    相同查询条件的后续请求会作为订阅方合并进来，共享同一份进度输出与最终结果。
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, params: dict, requester: str = None, on_line=None, on_start=None, on_done=None):
+        self.id = f"{time.strftime('%Y%m%d_%H%M%S')}_{next(self._ids)}"
+        self.params = params or {}
+        self.key = coalesce_key(self.params)
+        self.requester = requester
+        self.subscribers = [Subscriber(requester, on_line, on_start, on_done)]
+        self.lines = []
+        self.status = "queued"
+        self.output_dir = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def requesters(self) -> list:
+        return [s.requester for s in self.subscribers]
+
+    def attach(self, subscriber: Subscriber, running: bool) -> list:
+        """
+        加入一个订阅方，返回此前已产生的输出行（供其补发）。
+        任务已在执行时订阅方先处于补发状态：新行暂存，直到 catch_up 按顺序送达后才转为直连。
+        """
+        with self._lock:
+            if running:
+                subscriber.pending = []
+            self.subscribers.append(subscriber)
+            return list(self.lines)
+
+    def catch_up(self, subscriber: Subscriber, backlog: list):
+        """开始通知之后调用：依次补发已有进度与补发期间暂存的行，再转为直连；期间任务已结束则补发完成通知"""
+        for line in backlog:
+            JobScheduler._callback(self, subscriber.on_line, line)
+        while True:
+            with self._lock:
+                lines = subscriber.pending
+                if not lines:
+                    subscriber.pending = None
+                    deferred = subscriber.done_deferred
+                    break
+                subscriber.pending = []
+            for line in lines:
+                JobScheduler._callback(self, subscriber.on_line, line)
+        if deferred:
+            JobScheduler._callback(self, subscriber.on_done, self)
+
+    def publish(self, line: str):
+        """把一行输出分发给全部订阅方（仍在补发中的订阅方先暂存）"""
+        with self._lock:
+            self.lines.append(line)
+            live = []
+            for sub in self.subscribers:
+                if sub.pending is not None:
+                    sub.pending.append(line)
+                else:
+                    live.append(sub)
+        for sub in live:
+            JobScheduler._callback(self, sub.on_line, line)
+
+    def notify_done(self, subscriber: Subscriber):
+        """通知订阅方任务结束；仍在补发中的订阅方由 catch_up 在补发完后再通知，保证先开始、后结束"""
+        with self._lock:
+            if subscriber.pending is not None:
+                subscriber.done_deferred = True
+                return
+        JobScheduler._callback(self, subscriber.on_done, self)
+
+
+class JobScheduler:
+    """
+    巡检任务调度器：固定数量的常驻工作线程在进程内调用 main.run_inspection，替代每次请求拉起一个 main.py 子进程。
+    - 每个工作线程持有自己的 BrowserPool（Playwright 同步 API 有线程亲和性），浏览器、登录态与已导入的模块在任务之间保持热状态；
+    - 排队上限 max_queue，超出或同一用户已有未完成任务时拒绝提交（准入控制）；
+    - 提交时返回排队位置，供机器人回复“前面还有 N 个任务”；
+    - 查询条件（规范化后的 DYNAMIC_PARAMS）与排队中或执行中的任务相同时不再新建任务，而是合并进去：
+      补发已产生的进度，之后与发起人收到同样的进度、摘要卡片与附件；
+    - 每个任务的报表、摘要与调试截图写在独立的 jobs_dir/<任务ID>/ 下，多个任务可以安全地并行执行；
+      超过 retention_days 天的任务目录在之后的任务开始前清理。
+    对应配置项 scheduler：{"workers": 1, "max_queue": 10, "max_per_user": 1, "jobs_dir": "jobs", "retention_days": 3}
+    """
+
+    def __init__(self, config: dict):
+        conf = config.get("scheduler", {})
+        self.workers = max(1, int(conf.get("workers", 1)))
+        self.max_queue = max(1, int(conf.get("max_queue", 10)))
+        self.max_per_user = int(conf.get("max_per_user", 1))
+        self.jobs_dir = conf.get("jobs_dir", "jobs")
+        self.retention = float(conf.get("retention_days", 3)) * 86400
+        self.config = config
+        self._queue = queue.Queue()
+        self._waiting = []
+        self._running = []
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, args=(i,), name=f"inspection-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+
+    def _active_for(self, requester: str) -> int:
+        return sum(1 for j in self._waiting + self._running if requester in j.requesters)
+
+    def submit(self, params: dict, requester: str = None, on_line=None, on_start=None, on_done=None):
+        """
+        提交任务，返回 (job, 前面排队的任务数)；无法受理时抛出 QueueFull。
+        合并进已有任务时返回的是该任务，job.requester 为最初的发起人。
+        """
+        key = coalesce_key(params)
+        with self._lock:
+            shared = next((j for j in self._running + self._waiting if j.key == key), None)
+            if shared is not None:
+                if requester and requester in shared.requesters:
+                    raise QueueFull("相同条件的巡检任务正在进行，结果出来后会发给您，请勿重复发起")
+                if requester and self.max_per_user and self._active_for(requester) >= self.max_per_user:
+                    raise QueueFull("您已有一个巡检任务正在排队或执行，请等待其完成后再发起")
+                subscriber = Subscriber(requester, on_line, on_start, on_done)
+                running = shared.status == "running"
+                backlog = shared.attach(subscriber, running)
+                ahead = self._waiting.index(shared) if shared in self._waiting else 0
+        if shared is not None:
+            print(f"请求人 {requester} 的巡检请求已合并到任务 {shared.id}")
+            # 任务已在执行：补发开始通知与已产生的进度；仍在排队则随其他订阅方一起收到开始通知
+            if running:
+                self._callback(shared, on_start, shared)
+                shared.catch_up(subscriber, backlog)
+            return shared, ahead
+
+        with self._lock:
+            if len(self._waiting) >= self.max_queue:
+                raise QueueFull(f"当前已有 {len(self._waiting)} 个巡检任务在排队，请稍后再试")
+            if requester and self.max_per_user and self._active_for(requester) >= self.max_per_user:
+                raise QueueFull("您已有一个巡检任务正在排队或执行，请等待其完成后再发起")
+            job = InspectionJob(params, requester, on_line, on_start, on_done)
+            ahead = len(self._waiting) + max(0, len(self._running) - self.workers + 1)
+            self._waiting.append(job)
+            self._queue.put(job)
+        return job, ahead
+
+    def position(self, job: InspectionJob) -> int:
+        """任务前面还在排队的任务数；已开始执行返回 0"""
+        with self._lock:
+            return self._waiting.index(job) if job in self._waiting else 0
+
+    def _work(self, index: int):
+        # 浏览器在本线程内懒启动并一直复用，直到服务退出；
+        # 0 号线程沿用默认的登录态文件（与命令行共用），其余线程各用一份，避免互相覆盖或删除
+        state_file = "storage_state.json" if index == 0 else f"storage_state.worker{index}.json"
+        with BrowserPool(main.load_config(), state_file=state_file) as pool:
+            while True:
+                job = self._queue.get()
+                with self._lock:
+                    self._waiting.remove(job)
+                    self._running.append(job)
+                    # 与合并提交在同一把锁下切换状态，保证每个订阅方恰好收到一次开始通知
+                    job.status = "running"
+                    starters = list(job.subscribers)
+                try:
+                    self._run(job, pool, starters)
+                finally:
+                    with self._lock:
+                        if job in self._running:
+                            self._running.remove(job)
+                    job.finished.set()
+
+    def cleanup(self):
+        """删除超过保留期限的任务目录（执行中任务的目录刚创建，不会被误删）"""
+        try:
+            names = os.listdir(self.jobs_dir)
+        except OSError:
+            return
+        expire = time.time() - self.retention
+        for name in names:
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.isdir(path) and os.path.getmtime(path) < expire:
+                    shutil.rmtree(path)
+            except OSError as e:
+                print(f"清理过期任务目录 {path} 失败: {e}")
+
+    def _run(self, job: InspectionJob, pool: BrowserPool, starters: list):
+        print(f"开始执行巡检任务 {job.id}（请求人 {job.requester}）: {job.params}")
+        self.cleanup()
+        job.output_dir = os.path.join(self.jobs_dir, job.id)
+        for sub in starters:
+            self._callback(job, sub.on_start, job)
+        try:
+            with capture_output(job.publish):
+                job.result = main.run_inspection(job.params, pool=pool, output_dir=job.output_dir)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = e
+            print(f"巡检任务 {job.id} 执行失败: {e}")
+            # 浏览器状态未知，丢弃页面，下个任务重新导航
+            pool.invalidate()
+        # 先把任务移出执行列表再通知，之后的相同请求会新建任务而不是合并到已结束的任务
+        with self._lock:
+            self._running.remove(job)
+            subscribers = list(job.subscribers)
+        for sub in subscribers:
+            job.notify_done(sub)
+
+    @staticmethod
+    def _callback(job: InspectionJob, fn, *args):
+        if not fn:
+            return
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"巡检任务 {job.id} 回调出错: {e}")
@@ -3,12 +3,12 @@ from fastapi.responses import JSONResponse
 import uvicorn
 import json
 import os
-import subprocess
 from lark_utils import LarkUtils
+from job_scheduler import JobScheduler, QueueFull
+from progress import ProgressChannel
 import hashlib
 import base64
 from Crypto.Cipher import AES
-import sys
 import time
 import re
 from datetime import datetime
@@ -49,7 +49,11 @@ def load_config():
 
 config = load_config()
 lark_config = config.get("lark", {})
+# 进度卡片最多展示的行数
+PROGRESS_CARD_LINES = 30
 utils = LarkUtils(config)
+# 常驻工作线程在进程内执行巡检，浏览器与登录态在任务之间复用
+scheduler = JobScheduler(config)
 
 def parse_date(date_str):
     """尝试容错解析用户输入的日期，转为 YYYY-MM-DD，并且校验真实性"""
@@ -67,53 +71,50 @@ def parse_date(date_str):
 
 
 def run_inspection_and_reply_lark(receive_id: str, user_data: dict = None, receive_id_type: str = "open_id"):
-    """后台执行巡检并实时播报进度，最终发送卡片与文件"""
-    print(f"开始为飞书用户 {receive_id} 执行巡检任务...")
-    utils.send_text(receive_id, "收到指令，正在启动日志巡检，请稍候...", receive_id_type=receive_id_type)
-
-    try:
-        env = os.environ.copy()
-        if user_data:
-            env["DYNAMIC_PARAMS"] = json.dumps(user_data)
-
-        # ================= 核心升级：流式读取实时日志 =================
-        # 使用 Popen 替代 run，这样程序就可以边执行边输出
-        process = subprocess.Popen(
-            [sys.executable, "main.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,  # 将报错信息也合并进来防止漏看
-            text=True,
-            encoding='utf-8',
-            env=env,
-            bufsize=1  # 开启行缓冲，确保日志 0 延迟推送
-        )
-
-        # 实时逐行读取 main.py 的控制台打印
-        for line in iter(process.stdout.readline, ''):
-            clean_line = line.strip()
-            if not clean_line:
-                continue
-
-            print(f"巡检控制台: {clean_line}")  # 依然保留在本地服务端的终端显示
-
-            # 🎯 拦截带有 [PROGRESS] 标记的日志，立刻发射给飞书
-            if "[PROGRESS]" in clean_line:
-                # 稍微美化一下，把冰冷的 [PROGRESS] 替换成小图标，让气泡更好看
-                display_text = clean_line.replace("[PROGRESS]", "🚀").strip()
-                utils.send_text(receive_id, display_text, receive_id_type=receive_id_type)
-
-        process.stdout.close()
-        process.wait()  # 等待脚本彻底运行完毕
-        # ==============================================================
-
-        md_path = "report_summary.md"
-        excel_path = "error_logs.xlsx"
+    """把巡检任务交给常驻调度器排队执行，实时播报进度，最终发送卡片与文件"""
+    # 进度经后台通道攒批推送；默认只发一张进度卡片并原地刷新，失败时退回逐批发文本
+    progress = {"lines": [], "card_id": None, "channel": None}
+
+    def push_progress(batch):
+        progress["lines"].extend(batch)
+        if lark_config.get("progress_card", True):
+            # 卡片只保留最近的进度，避免内容过长
+            md_text = "\n".join(progress["lines"][-PROGRESS_CARD_LINES:])
+            if progress["card_id"]:
+                if utils.update_card(progress["card_id"], md_text, title="⏳ 巡检进行中"):
+                    return
+            else:
+                progress["card_id"] = utils.send_updatable_card(receive_id, md_text, title="⏳ 巡检进行中",
+                                                                receive_id_type=receive_id_type)
+                if progress["card_id"]:
+                    return
+        utils.send_text(receive_id, "\n".join(batch), receive_id_type=receive_id_type)
+
+    def on_line(clean_line):
+        # 🎯 拦截带有 [PROGRESS] 标记的日志，交给进度通道发射给飞书（不阻塞巡检线程）
+        if "[PROGRESS]" in clean_line and progress["channel"]:
+            # 稍微美化一下，把冰冷的 [PROGRESS] 替换成小图标，让气泡更好看
+            display_text = clean_line.replace("[PROGRESS]", "🚀").strip()
+            progress["channel"].push(display_text)
+
+    def on_start(job):
+        print(f"开始为飞书用户 {receive_id} 执行巡检任务 {job.id}...")
+        utils.send_text(receive_id, "收到指令，正在启动日志巡检，请稍候...", receive_id_type=receive_id_type)
+        progress["channel"] = ProgressChannel(push_progress, config)
+
+    def on_done(job):
+        # 先把剩余进度推完，保证最终卡片排在进度之后
+        if progress["channel"]:
+            progress["channel"].close()
+        if job.error is not None:
+            utils.send_text(receive_id, f"执行巡检时发生致命错误: {job.error}", receive_id_type=receive_id_type)
+            return
+        result = job.result
+        md_content = result.summary
+        excel_path = next((f for f in result.files if f.endswith(".xlsx")), None)
 
         # 1. 优先发送炫酷的可视化卡片
-        if os.path.exists(md_path):
-            with open(md_path, "r", encoding="utf-8") as f:
-                md_content = f.read()
-
+        if md_content:
             if "🎉" in md_content:
                 utils.send_markdown_card(receive_id, md_content, title="✅ 巡检正常", template="green",
                                          receive_id_type=receive_id_type)
@@ -124,16 +125,25 @@ def run_inspection_and_reply_lark(receive_id: str, user_data: dict = None, recei
             utils.send_text(receive_id, "巡检已执行完毕。", receive_id_type=receive_id_type)
 
         # 2. 如果有文件，作为附件紧跟着发送
-        if os.path.exists(excel_path):
+        if excel_path and os.path.exists(excel_path):
             file_key = utils.upload_file(excel_path)
             if file_key:
                 utils.send_file(receive_id, file_key, receive_id_type=receive_id_type)
             else:
                 utils.send_text(receive_id, "⚠️ 巡检已完成，但长篇 Excel 报告上传失败。", receive_id_type=receive_id_type)
 
-    except Exception as e:
-        print(f"飞书平台执行巡检出错: {e}")
-        utils.send_text(receive_id, f"执行巡检时发生致命错误: {str(e)}", receive_id_type=receive_id_type)
+    try:
+        job, ahead = scheduler.submit(user_data, requester=receive_id,
+                                      on_line=on_line, on_start=on_start, on_done=on_done)
+    except QueueFull as e:
+        utils.send_text(receive_id, f"⚠️ {e}", receive_id_type=receive_id_type)
+        return
+    if job.requester != receive_id:
+        # 相同查询条件的任务已在排队或执行，合并后与发起人共享进度与结果
+        utils.send_text(receive_id, "🔗 已有相同条件的巡检任务在进行，已为您合并，进度与结果将同步推送。", receive_id_type=receive_id_type)
+    elif ahead:
+        utils.send_text(receive_id, f"⏳ 巡检任务已排队，前面还有 {ahead} 个任务，轮到您时将自动开始。",
+                        receive_id_type=receive_id_type)
 
 @app.post("/lark")
 async def handle_lark_event(request: Request, background_tasks: BackgroundTasks):
@@ -196,7 +206,7 @@ async def handle_lark_event(request: Request, background_tasks: BackgroundTasks)
                 if text in ["巡检", "开始巡检", "run"]:
                     # 开辟新的会话状态
                     lark_sessions[open_id] = {"step": "START_DATE", "retries": 0, "data": {}}
-                    utils.send_text(open_id, "已收到指令。请回复「开始日期」 (支持 2026/02/12、2026-02-12 或 20260212 格式):")
+                    await utils.asend_text(open_id, "已收到指令。请回复「开始日期」 (支持 2026/02/12、2026-02-12 或 20260212 格式):")
                     return {"code": 0, "msg": "ok"}
                 
                 # 如果当前存在上下话会话，处理参数收集
@@ -210,14 +220,14 @@ async def handle_lark_event(request: Request, background_tasks: BackgroundTasks)
                             session["data"]["start_date"] = p_date
                             session["step"] = "END_DATE"
                             session["retries"] = 0
-                            utils.send_text(open_id, f"✅ 已记录开始日期: {p_date}\n请回复「结束日期」 (格式同上):")
+                            await utils.asend_text(open_id, f"✅ 已记录开始日期: {p_date}\n请回复「结束日期」 (格式同上):")
                         else:
                             session["retries"] += 1
                             if session["retries"] >= 3:
                                 del lark_sessions[open_id]
-                                utils.send_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
+                                await utils.asend_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
                             else:
-                                utils.send_text(open_id, "⚠️ 日期格式不正确，请重新回复「开始日期」:")
+                                await utils.asend_text(open_id, "⚠️ 日期格式不正确，请重新回复「开始日期」:")
                                 
                     elif step == "END_DATE":
                         p_date = parse_date(text)
@@ -225,14 +235,14 @@ async def handle_lark_event(request: Request, background_tasks: BackgroundTasks)
                             session["data"]["end_date"] = p_date
                             session["step"] = "STATUS"
                             session["retries"] = 0
-                            utils.send_text(open_id, f"✅ 已记录结束日期: {p_date}\n请回复排查「状态」\n(填写: 0 代表成功, 1 代表失败, 2 代表所有状态):")
+                            await utils.asend_text(open_id, f"✅ 已记录结束日期: {p_date}\n请回复排查「状态」\n(填写: 0 代表成功, 1 代表失败, 2 代表所有状态):")
                         else:
                             session["retries"] += 1
                             if session["retries"] >= 3:
                                 del lark_sessions[open_id]
-                                utils.send_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
+                                await utils.asend_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
                             else:
-                                utils.send_text(open_id, "⚠️ 日期格式不正确，请重新回复「结束日期」:")
+                                await utils.asend_text(open_id, "⚠️ 日期格式不正确，请重新回复「结束日期」:")
                                 
                     elif step == "STATUS":
                         status_val = str(text.strip())
@@ -244,21 +254,23 @@ async def handle_lark_event(request: Request, background_tasks: BackgroundTasks)
                             # 获取配置中的流选项，预备菜单
                             flow_opts = config.get("integration_flows", ["所有"])
                             opts_str = "\n".join([f"{i}. {opt}" for i, opt in enumerate(flow_opts, 1)])
-                            utils.send_text(open_id, f"✅ 已记录状态过滤。\n请回复「集成流选单对应的编号」：\n{opts_str}")
+                            await utils.asend_text(open_id, f"✅ 已记录状态过滤。\n请回复「集成流选单对应的编号」（多个编号用逗号分隔）：\n{opts_str}")
                         else:
                             session["retries"] += 1
                             if session["retries"] >= 3:
                                 del lark_sessions[open_id]
-                                utils.send_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
+                                await utils.asend_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
                             else:
-                                utils.send_text(open_id, "⚠️ 状态不正确 (必须是 0 或 1 或 2)，请重试:")
+                                await utils.asend_text(open_id, "⚠️ 状态不正确 (必须是 0 或 1 或 2)，请重试:")
                                 
                     elif step == "FLOW":
                         flow_opts = config.get("integration_flows", ["所有"])
                         try:
-                            choice = int(text.strip())
-                            if 1 <= choice <= len(flow_opts):
-                                selected_flow = flow_opts[choice - 1]
+                            # 支持一次选择多个集成流，如 "3,5,7"，引擎会并发扇出查询后合并为一份报告
+                            choices = [int(x) for x in re.split(r"[,，、\s]+", text.strip()) if x]
+                            if choices and all(1 <= c <= len(flow_opts) for c in choices):
+                                selected = [flow_opts[c - 1] for c in choices]
+                                selected_flow = selected[0] if len(selected) == 1 else selected
                                 session["data"]["integration_flow"] = selected_flow
                                 user_data = session["data"].copy()
                                 del lark_sessions[open_id]
@@ -271,14 +283,14 @@ async def handle_lark_event(request: Request, background_tasks: BackgroundTasks)
                             session["retries"] += 1
                             if session["retries"] >= 3:
                                 del lark_sessions[open_id]
-                                utils.send_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
+                                await utils.asend_text(open_id, "❌ 错误次数超过 3 次，已取消本次巡检创建。")
                             else:
-                                utils.send_text(open_id, "⚠️ 输入不是有效的菜单编号，请重新输入:")
+                                await utils.asend_text(open_id, "⚠️ 输入不是有效的菜单编号，请重新输入:")
                     
                     return {"code": 0, "msg": "ok"}
                 else:
                     # 如果发了别的且不在会话中，提示下
-                    utils.send_text(open_id, "⚠️ 输入指令有误，请向我发送「巡检」、「开始巡检」或「run」中的任意一个指令以启动巡检向导。")
+                    await utils.asend_text(open_id, "⚠️ 输入指令有误，请向我发送「巡检」、「开始巡检」或「run」中的任意一个指令以启动巡检向导。")
                     
             except Exception as e:
                 print(f"解析飞书消息内容或处理状态机时失败: {e}")
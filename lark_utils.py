@@ -1,7 +1,8 @@
-import requests
 import json
 import time
 import os
+import threading
+from im_http import build_session, timeouts, to_async
 
 class LarkUtils:
     def __init__(self, config):
@@ -10,12 +11,21 @@ class LarkUtils:
         self.app_secret = self.config.get("app_secret")
         self.tenant_access_token = None
         self.token_expiry = 0
+        # 连接池复用 keep-alive 连接；多个线程同时发现 token 过期时只刷新一次
+        self.session = build_session(config)
+        self.timeout, self.upload_timeout = timeouts(config)
+        self._token_lock = threading.Lock()
 
     def get_tenant_access_token(self):
         """获取或刷新 Tenant Access Token"""
         if self.tenant_access_token and time.time() < self.token_expiry:
             return self.tenant_access_token
+        with self._token_lock:
+            if self.tenant_access_token and time.time() < self.token_expiry:
+                return self.tenant_access_token
+            return self._refresh_token()
 
+    def _refresh_token(self):
         url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
         headers = {"Content-Type": "application/json; charset=utf-8"}
         payload = {
@@ -23,7 +33,7 @@ class LarkUtils:
             "app_secret": self.app_secret
         }
         try:
-            resp = requests.post(url, headers=headers, json=payload).json()
+            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout).json()
             if resp.get("code") == 0:
                 self.tenant_access_token = resp.get("tenant_access_token")
                 # 提前 5 分钟刷新
@@ -64,7 +74,8 @@ class LarkUtils:
                 files = {
                     "file": (file_name, f, "application/octet-stream")
                 }
-                resp = requests.post(url, headers=headers, data=data, files=files).json()
+                resp = self.session.post(url, headers=headers, data=data, files=files,
+                                         timeout=self.upload_timeout).json()
 
             if resp.get("code") == 0:
                 return resp.get("data", {}).get("file_key")
@@ -91,7 +102,7 @@ class LarkUtils:
             "content": json.dumps({"file_key": file_key})
         }
         try:
-            resp = requests.post(url, headers=headers, json=payload).json()
+            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout).json()
             # 💡 改进3：增加错误打印，一旦没权限或参数错，控制台立马现身
             if resp.get("code") != 0:
                 print(f"❌ 飞书发送文件消息失败: {resp}")
@@ -117,7 +128,7 @@ class LarkUtils:
             "content": json.dumps({"text": text})
         }
         try:
-            resp = requests.post(url, headers=headers, json=payload).json()
+            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout).json()
             # 💡 改进3：同上
             if resp.get("code") != 0:
                 print(f"❌ 飞书发送文本消息失败: {resp}")
@@ -138,10 +149,30 @@ class LarkUtils:
             "Content-Type": "application/json; charset=utf-8"
         }
 
-        # 构造飞书卡片结构，增加彩色 Header
-        card_content = {
+        card_content = self._markdown_card(md_text, title, template)
+
+        payload = {
+            "receive_id": receive_id,
+            "msg_type": "interactive",
+            "content": json.dumps(card_content)
+        }
+
+        try:
+            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout).json()
+            if resp.get("code") != 0:
+                print(f"❌ 飞书发送卡片失败: {resp}")
+            return resp.get("code") == 0
+        except Exception as e:
+            print(f"❌ 飞书发送卡片异常: {e}")
+            return False
+
+    @staticmethod
+    def _markdown_card(md_text, title, template, update_multi=False):
+        # 构造飞书卡片结构，增加彩色 Header；update_multi 为共享卡片，发送后可以原地更新
+        return {
             "config": {
-                "wide_screen_mode": True
+                "wide_screen_mode": True,
+                "update_multi": update_multi
             },
             "header": {
                 "template": template,
@@ -158,17 +189,59 @@ class LarkUtils:
             ]
         }
 
+    def send_updatable_card(self, receive_id, md_text, title="巡检进度", template="blue", receive_id_type="open_id"):
+        """发送一张可原地更新的卡片（用于滚动刷新进度），返回 message_id，失败返回 None"""
+        token = self.get_tenant_access_token()
+        if not token:
+            return None
+
+        url = f"https://open.feishu.cn/open-apis/im/v1/messages?receive_id_type={receive_id_type}"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
         payload = {
             "receive_id": receive_id,
             "msg_type": "interactive",
-            "content": json.dumps(card_content)
+            "content": json.dumps(self._markdown_card(md_text, title, template, update_multi=True))
         }
+        try:
+            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout).json()
+            if resp.get("code") != 0:
+                print(f"❌ 飞书发送进度卡片失败: {resp}")
+                return None
+            return resp.get("data", {}).get("message_id")
+        except Exception as e:
+            print(f"❌ 飞书发送进度卡片异常: {e}")
+            return None
+
+    def update_card(self, message_id, md_text, title="巡检进度", template="blue"):
+        """原地更新 send_updatable_card 发出的卡片内容"""
+        token = self.get_tenant_access_token()
+        if not token:
+            return False
 
+        url = f"https://open.feishu.cn/open-apis/im/v1/messages/{message_id}"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        payload = {
+            "content": json.dumps(self._markdown_card(md_text, title, template, update_multi=True))
+        }
         try:
-            resp = requests.post(url, headers=headers, json=payload).json()
+            resp = self.session.patch(url, headers=headers, json=payload, timeout=self.timeout).json()
             if resp.get("code") != 0:
-                print(f"❌ 飞书发送卡片失败: {resp}")
+                print(f"❌ 飞书更新卡片失败: {resp}")
             return resp.get("code") == 0
         except Exception as e:
-            print(f"❌ 飞书发送卡片异常: {e}")
-            return False
\ No newline at end of file
+            print(f"❌ 飞书更新卡片异常: {e}")
+            return False
+
+    # 异步版本：供 FastAPI 的 async 处理函数 await，同步接口保持不变
+    aupload_file = to_async(upload_file)
+    asend_file = to_async(send_file)
+    asend_text = to_async(send_text)
+    asend_markdown_card = to_async(send_markdown_card)
+    asend_updatable_card = to_async(send_updatable_card)
+    aupdate_card = to_async(update_card)
\ No newline at end of file
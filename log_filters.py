@@ -0,0 +1,283 @@
+import re
+import json
+import time
+import hashlib
+import functools
+import pandas as pd
+from log_templates import TemplateMiner
+
+try:
+    import pyarrow  # noqa: F401  仅用于判断能否使用 Arrow 字符串类型
+    TEXT_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    TEXT_DTYPE = None
+
+
+class WhitelistMatcher:
+    """
+    白名单匹配器：把所有忽略词条转义后编译成一个正则（长词条在前，避免被其前缀抢先命中），
+    对消息列只扫描一遍即可得到要剔除的行，同时统计每个词条实际命中的行数。
+    一行同时包含多个词条时，计入最先出现的那个。
+    """
+
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(str(t) for t in terms if t))
+        ordered = sorted(self.terms, key=len, reverse=True)
+        self.pattern = re.compile("(" + "|".join(map(re.escape, ordered)) + ")") if ordered else None
+
+    def match(self, series: pd.Series):
+        """返回 (命中掩码, {词条: 命中行数})，命中数为 0 的词条也会列出"""
+        hits = dict.fromkeys(self.terms, 0)
+        if self.pattern is None or series.empty:
+            return pd.Series(False, index=series.index), hits
+        found = series.astype(str).str.extract(self.pattern, expand=False)
+        mask = found.notna()
+        hits.update(found[mask].value_counts().to_dict())
+        return mask, hits
+
+
+@functools.lru_cache(maxsize=16)
+def whitelist_matcher(terms: tuple) -> WhitelistMatcher:
+    """同一份白名单只编译一次（长驻服务中多次巡检共用）"""
+    return WhitelistMatcher(terms)
+
+
+# 默认规则与原先写死在 process_and_save_data 中的清洗步骤完全一致（顺序有意义）：
+# 第一重去重必须放在状态清洗之前——同一报文最后一次重试成功(0)时，先保留这条 0 覆盖历史报错(1)，
+# 再由状态清洗把 0 剔除，这种“已自愈”的报错就不会出现在报表中
+DEFAULT_FILTER_RULES = [
+    {"name": "移除无用列", "type": "drop_columns", "columns": ["主键", "编码"]},
+    {"name": "白名单过滤", "type": "exclude", "column": "消息", "match": "contains", "values_from": "whitelist"},
+    {"name": "屏蔽华夏集成流", "type": "exclude", "column": "集成流", "match": "contains", "values": ["华夏"]},
+    {"name": "日期过滤", "type": "date_range", "column": "创建时间"},
+    {"name": "时序去重", "type": "dedup", "keys": ["集成流", "请求报文"], "order_by": "创建时间",
+     "digest": ["请求报文"]},
+    {"name": "状态清洗", "type": "exclude", "column": "状态", "match": "in", "values": ["0", "0.0"]},
+    {"name": "模板去重", "type": "dedup", "keys": ["集成流", "消息"], "order_by": "创建时间",
+     "template": ["消息"], "template_column": "模板ID"},
+]
+
+
+_INTER_TAG_SPACE = re.compile(r">\s+<")
+
+
+def canonical_payload(text: str) -> str:
+    """报文规范化：JSON 按键排序并去掉多余空白；XML / 纯文本去掉首尾及标签之间的空白"""
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return json.dumps(json.loads(stripped), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        except ValueError:
+            pass
+    return _INTER_TAG_SPACE.sub("><", stripped)
+
+
+def payload_digest(text: str, canonical: bool = False) -> int:
+    """报文的 64 位 blake2b 摘要，以有符号整数返回，便于 pandas 按数值列排序、去重"""
+    if canonical:
+        text = canonical_payload(text)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def compact_dtypes(df: pd.DataFrame, time_keyword: str = "创建时间", category_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    压缩日志表的内存占用：
+    - 时间列按显式格式一次性解析为 datetime64（有无法解析的非空值时保留原文本），后续日期过滤与排序直接使用；
+    - 取值重复度高的列（不同取值数不超过行数的 category_ratio，如集成流、状态）转为 category；
+    - 其余文本列在安装了 pyarrow 时转为 Arrow 字符串类型。
+    """
+    if df.empty:
+        return df
+    time_col = find_column(df, time_keyword)
+    out = {}
+    for col in df.columns:
+        values = df[col]
+        if col == time_col:
+            parsed = pd.to_datetime(values, format=TIME_FORMAT, errors='coerce')
+            unparsed = parsed.isna() & values.ne('')
+            if unparsed.any():
+                parsed = pd.to_datetime(values, format="mixed", errors='coerce')
+                unparsed = parsed.isna() & values.ne('')
+            if not unparsed.any():
+                out[col] = parsed
+                continue
+        if values.nunique() <= max(1, len(values) * category_ratio):
+            out[col] = values.astype("category")
+        elif TEXT_DTYPE is not None:
+            out[col] = values.astype(TEXT_DTYPE)
+        else:
+            out[col] = values
+    return pd.DataFrame(out, index=df.index)
+
+
+def find_column(df: pd.DataFrame, keyword: str):
+    """按关键字模糊匹配列名（与前端表头的叫法保持宽松兼容），取第一个"""
+    return next((c for c in df.columns if keyword in c), None)
+
+
+class FilterPipeline:
+    """
+    声明式过滤规则流水线，对应配置项 filter_rules（不配置时使用 DEFAULT_FILTER_RULES）。规则类型：
+    - include / exclude：按列保留或剔除，match 为 contains（子串，多词条合成单次扫描）/ regex / in（取值集合）；
+      values 为取值列表，values_from 可引用配置中的另一个列表（如 whitelist）
+    - date_range：按列裁剪到配置的 start_date ~ end_date（结束日期含当天）
+    - dedup：按 keys 去重，order_by 列倒序保留最新一条；normalize 可先把某列中匹配的片段替换为 *；
+      digest 中的大字段列（如请求报文）先算成定长摘要再参与排序去重，canonical_json 为 true 时忽略 JSON 键序与空白；
+      template 中的消息列先归并为日志模板 ID（见 log_templates.py）再去重，template_column 指定时把模板 ID 作为新列保留
+    - drop_columns：按列名删除列
+    相邻的行过滤规则只计算布尔掩码并合并，遇到去重（需要排序）或流水线结束时才生成一次新的 DataFrame。
+    """
+
+    def __init__(self, rules: list, config: dict):
+        self.config = config
+        self.rules = []
+        for rule in rules:
+            if not rule.get("enabled", True):
+                continue
+            try:
+                self.rules.append(self._compile(rule))
+            except (KeyError, ValueError, re.error) as e:
+                print(f"过滤规则 {rule.get('name') or rule} 配置有误，已跳过: {e}")
+
+    def _compile(self, rule: dict):
+        kind = rule.get("type")
+        name = rule.get("name") or kind
+        if kind in ("include", "exclude"):
+            return name, "mask", self._compile_match(rule, kind == "include")
+        if kind == "date_range":
+            return name, "mask", self._compile_date_range(rule)
+        if kind == "dedup":
+            return name, "frame", self._compile_dedup(rule)
+        if kind == "drop_columns":
+            return name, "columns", lambda df: df.drop(columns=[c for c in rule["columns"] if c in df.columns])
+        raise ValueError(f"未知的规则类型 {kind}")
+
+    def _compile_match(self, rule: dict, include: bool):
+        keyword = rule["column"]
+        values = list(rule.get("values") or [])
+        if rule.get("values_from"):
+            values = list(self.config.get(rule["values_from"]) or []) + values
+        values = [str(v) for v in values if v not in (None, "")]
+        match = rule.get("match", "contains")
+        if match == "contains":
+            matcher = whitelist_matcher(tuple(values))
+        elif match == "regex":
+            pattern = re.compile("|".join(f"(?:{v})" for v in values)) if values else None
+        elif match == "in":
+            value_set = set(values)
+        else:
+            raise ValueError(f"未知的匹配方式 {match}")
+
+        def evaluate(df):
+            col = find_column(df, keyword)
+            if col is None or not values or df.empty:
+                return None, None
+            hits = None
+            if match == "contains":
+                hit, hits = matcher.match(df[col])
+            elif match == "regex":
+                hit = df[col].astype(str).str.contains(pattern, na=False)
+            else:
+                hit = df[col].astype(str).str.strip().isin(value_set)
+            return (hit if include else ~hit), hits
+        return evaluate
+
+    def _compile_date_range(self, rule: dict):
+        keyword = rule.get("column", "创建时间")
+        start = rule.get("start", self.config.get("start_date"))
+        end = rule.get("end", self.config.get("end_date"))
+        s_date = pd.to_datetime(str(start)) if start else None
+        e_date = pd.to_datetime(str(end)).replace(hour=23, minute=59, second=59) if end else None
+
+        def evaluate(df):
+            col = find_column(df, keyword)
+            if col is None or (s_date is None and e_date is None) or df.empty:
+                return None, None
+            dates = df[col] if pd.api.types.is_datetime64_any_dtype(df[col]) else pd.to_datetime(df[col], errors='coerce')
+            keep = pd.Series(True, index=df.index)
+            if s_date is not None:
+                keep &= dates >= s_date
+            if e_date is not None:
+                keep &= dates <= e_date
+            return keep, None
+        return evaluate
+
+    def _compile_dedup(self, rule: dict):
+        keys = list(rule["keys"])
+        order_by = rule.get("order_by")
+        normalize = {k: re.compile(p) for k, p in (rule.get("normalize") or {}).items()}
+        digest = list(rule.get("digest") or [])
+        canonical = bool(rule.get("canonical_json", False))
+        template = list(rule.get("template") or [])
+        template_column = rule.get("template_column")
+
+        def apply(df):
+            cols = [c for c in dict.fromkeys(find_column(df, k) for k in keys) if c]
+            order_col = find_column(df, order_by) if order_by else None
+            if not cols or (order_by and order_col is None) or df.empty:
+                return df
+            # 需要归一化或摘要的键列先生成临时列，去重后删掉；原始大字段不参与排序与哈希
+            subset, temp = [], []
+            for i, col in enumerate(cols):
+                pattern = next((p for k, p in normalize.items() if k in col), None)
+                hashed = any(k in col for k in digest)
+                if any(k in col for k in template):
+                    miner = TemplateMiner.for_config(self.config)
+                    key = pd.Series(miner.assign(df[col].tolist()), index=df.index)
+                    miner.save()
+                    tmp_col = template_column or f"_dedup_key_{i}"
+                    df = df.assign(**{tmp_col: key})
+                    subset.append(tmp_col)
+                    if not template_column:
+                        temp.append(tmp_col)
+                    continue
+                if pattern is None and not hashed:
+                    subset.append(col)
+                    continue
+                key = df[col]
+                if pattern is not None:
+                    key = key.str.replace(pattern, '*', regex=True)
+                if hashed:
+                    key = pd.Series([payload_digest(v, canonical) for v in key.astype(str).tolist()],
+                                    index=df.index, dtype="int64")
+                tmp_col = f"_dedup_key_{i}"
+                df = df.assign(**{tmp_col: key})
+                subset.append(tmp_col)
+                temp.append(tmp_col)
+            if order_col:
+                df = df.sort_values(by=subset + [order_col], ascending=[True] * len(subset) + [False])
+            df = df.drop_duplicates(subset=subset, keep='first')
+            return df.drop(columns=temp) if temp else df
+        return apply
+
+    def run(self, df: pd.DataFrame):
+        """依次执行规则，返回 (过滤后的 DataFrame, 每条规则的统计)"""
+        stats = []
+        keep = None
+        for name, kind, fn in self.rules:
+            started = time.perf_counter()
+            rows_in = len(df) if keep is None else int(keep.sum())
+            hits = None
+            if kind == "columns":
+                df = fn(df)
+            elif kind == "mask":
+                mask, hits = fn(df)
+                if mask is not None:
+                    keep = mask if keep is None else keep & mask
+            else:
+                if keep is not None:
+                    df = df[keep]
+                    keep = None
+                df = fn(df)
+            rows_out = len(df) if keep is None else int(keep.sum())
+            stat = {"name": name, "rows_in": rows_in, "removed": rows_in - rows_out, "rows_out": rows_out,
+                    "seconds": round(time.perf_counter() - started, 4)}
+            if hits is not None:
+                stat["hits"] = hits
+            stats.append(stat)
+        if keep is not None:
+            df = df[keep]
+        return df, stats
@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import threading
+
+# 预编译的变量遮罩，按顺序合成一个正则：同一位置先匹配到的规则优先（UUID 先于 ID、时间先于数字）
+MASKS = [
+    ("UUID", r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"),
+    ("TIME", r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}(?:[ T]\d{1,2}:\d{2}(?::\d{2})?(?:\.\d+)?)?|\d{1,2}:\d{2}:\d{2}(?:\.\d+)?"),
+    ("IP", r"\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?"),
+    ("HEX", r"0[xX][0-9a-fA-F]+|(?<![0-9A-Za-z])(?=[a-fA-F]*\d)[0-9a-fA-F]{16,}(?![0-9A-Za-z])"),
+    # 字母数字混合的单号或带单位的数值，如 PO20260226A01、CG-2026-0001、PO1、16ms；
+    # 不设长度下限：长短不同的同类取值必须遮罩成相同的词元数，否则（9ms / 16ms）永远无法归并
+    ("ID", r"(?<![0-9A-Za-z])(?=[A-Za-z_\-]*\d)(?=[0-9_\-]*[A-Za-z])[A-Za-z0-9_\-]+(?![0-9A-Za-z])"),
+    ("NUM", r"\d+(?:\.\d+)?"),
+]
+_MASK = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in MASKS))
+_TOKEN = re.compile(r"<[A-Z]+>|\w+|[^\w\s]")
+WILDCARD = "<*>"
+# 缓存文件格式版本：早期版本允许普通词元不同的消息合并，其模板与精确映射可能已过度泛化，升级后丢弃重建
+CACHE_VERSION = 2
+
+
+def is_variable(token: str) -> bool:
+    """词元是否为遮罩占位符或已泛化的通配符"""
+    return len(token) > 2 and token[0] == "<" and token[-1] == ">"
+
+
+def mask_message(message: str) -> str:
+    """把消息中的 UUID、时间、IP、十六进制串、单号与数字替换为占位符"""
+    return _MASK.sub(lambda m: f"<{m.lastgroup}>", message.strip())
+
+
+class TemplateMiner:
+    """
+    Drain 风格的日志模板挖掘：消息先经预编译规则遮罩变量，再按 (词元数, 首个词元) 分组，与组内已有模板逐位比较。
+    合并是保守的：只有两边都是变量占位符的位置允许不同（泛化为 <*>），任何普通词元不同都新建模板——
+    \\w+ 会把一整段中文切成一个词元，按相同位置占比合并会把“接口返回错误：库存不足 / 价格错误”这类不同报错并成一条；
+    满足该条件后相同位置占比还需不低于 similarity。
+    模板与“遮罩后文本 → 模板 ID”的精确映射落盘到 cache/log_templates.json，
+    已见过的消息在下一次巡检中直接查表命中，只有新消息才参与聚类；模板 ID 一经分配不再变化。
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str, similarity: float = 0.5, max_exact: int = 50000):
+        self.path = path
+        self.similarity = similarity
+        self.max_exact = max_exact
+        self.templates = {}
+        self.groups = {}
+        self.exact = {}
+        self.next_id = 1
+        self.dirty = False
+        self.lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_config(cls, config: dict):
+        """同一状态目录在进程内共用一个实例（长驻服务中多次巡检共享已学到的模板）"""
+        path = os.path.join(config.get("state_dir", "cache"), "log_templates.json")
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path, similarity=float(config.get("template_similarity", 0.5)))
+            return cls._instances[path]
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != CACHE_VERSION:
+            print("日志模板缓存格式已升级，旧模板可能存在过度合并，已丢弃并重新学习")
+            self.dirty = True
+            return
+        self.next_id = data.get("next_id", 1)
+        self.exact = data.get("exact", {})
+        for tid, tokens in data.get("templates", {}).items():
+            self.templates[tid] = tokens
+            self.groups.setdefault(self._group_key(tokens), []).append(tid)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {"version": CACHE_VERSION, "next_id": self.next_id, "templates": self.templates, "exact": self.exact}
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"保存日志模板缓存失败: {e}")
+
+    @staticmethod
+    def _group_key(tokens: list) -> str:
+        return f"{len(tokens)}|{tokens[0] if tokens else ''}"
+
+    @staticmethod
+    def _score(template: list, tokens: list) -> float:
+        """相同位置占比；有普通词元不同（不是两边都是变量）时返回 -1，表示不可合并"""
+        if not tokens:
+            return 1.0
+        same = 0
+        for a, b in zip(template, tokens):
+            if a == b or a == WILDCARD:
+                same += 1
+            elif not (is_variable(a) and is_variable(b)):
+                return -1.0
+        return same / len(tokens)
+
+    def template_id(self, message: str) -> str:
+        masked = mask_message(message)
+        tid = self.exact.get(masked)
+        if tid is not None:
+            return tid
+        tokens = _TOKEN.findall(masked)
+        with self.lock:
+            key = self._group_key(tokens)
+            best, best_score = None, -1.0
+            for candidate in self.groups.get(key, []):
+                score = self._score(self.templates[candidate], tokens)
+                if score > best_score:
+                    best, best_score = candidate, score
+            if best is not None and best_score >= 0 and best_score >= self.similarity:
+                tid = best
+                self.templates[tid] = [a if a == b else WILDCARD for a, b in zip(self.templates[tid], tokens)]
+            else:
+                tid = f"T{self.next_id:05d}"
+                self.next_id += 1
+                self.templates[tid] = tokens
+                self.groups.setdefault(key, []).append(tid)
+            if len(self.exact) < self.max_exact:
+                self.exact[masked] = tid
+            self.dirty = True
+        return tid
+
+    def template_text(self, tid: str) -> str:
+        return " ".join(self.templates.get(tid, []))
+
+    def assign(self, messages):
+        """为一列消息分配模板 ID：只对去重后的消息做遮罩与匹配，返回与输入等长的列表"""
+        values = [str(m) for m in messages]
+        mapping = {m: self.template_id(m) for m in dict.fromkeys(values)}
+        return [mapping[m] for m in values]
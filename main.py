@@ -1,9 +1,48 @@
 import os
+import re
 import json
 import io
+import time
 import pandas as pd
-from playwright.sync_api import sync_playwright
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from playwright.sync_api import expect, TimeoutError as PlaywrightTimeoutError
+from browser_pool import BrowserPool, SessionExpired
+from progress import carry_context
+import report_api
+from report_api import ReportTemplate, TemplateStore
+from incremental import IncrementalStore, rows_for_flow
+from response_cache import ResponseCache
+from report_export import export_report, export_paths, DEFAULT_FORMATS, EXTENSIONS
+from history_store import HistoryStore
+from log_filters import FilterPipeline, DEFAULT_FILTER_RULES, find_column, compact_dtypes
+
+
+@dataclass
+class InspectionResult:
+    """
+    一次巡检的结构化结果，抓取阶段与清洗阶段之间直接传递对象，不再经过带前缀的字符串和 JSON 往返。
+    抓取阶段填写 header/rows（原始 cells 表格）、fallback_text（DOM 保底文本）或 error 之一，外加 meta；
+    清洗阶段补充最终的 df、提示信息 message、摘要 summary 与生成的文件列表 files。
+    所有文件都写在 output_dir 下（为空即当前目录）；抓取失败时保存的截图与 DOM 记在 debug_files 中。
+    """
+    header: list = field(default_factory=list)
+    rows: list = field(default_factory=list)
+    fallback_text: str = None
+    error: str = None
+    meta: dict = field(default_factory=dict)
+    df: pd.DataFrame = None
+    message: str = None
+    summary: str = None
+    files: list = field(default_factory=list)
+    output_dir: str = ""
+    debug_files: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
 
 def load_config() -> dict:
     conf = {}
@@ -22,327 +61,530 @@ def load_config() -> dict:
             
     return conf
 
-def scrape_logs(config: dict) -> str:
+def output_path(config: dict, name: str) -> str:
+    """本次巡检输出文件的路径：配置了 output_dir（如调度器为每个任务分配的目录）时写在其中，否则写在当前目录"""
+    return os.path.join(config.get("output_dir") or "", name)
+
+
+def scrape_logs(config: dict, pool: BrowserPool = None) -> InspectionResult:
     """
-    使用 Playwright 抓取异常日志文本
+    使用 Playwright 抓取异常日志，返回 InspectionResult（表格 / 保底文本 / 错误信息）。
+    传入长驻的 BrowserPool 时复用其浏览器、登录态与已打开的日志页；
+    否则临时创建一个（仍会复用落盘的登录 Cookie），用完即关闭。
+    integration_flow 为列表或日期跨度较大时，拆成多个子查询并发扇出，结果合并为一份报告。
     """
-    print("[PROGRESS] 正在启动浏览器环境...")
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
+    report_api.cells_locator.bind(config)
+    own_pool = pool is None
+    if own_pool:
+        pool = BrowserPool(config)
 
+    try:
+        cached = []
+        queries = _split_queries(pool, config, cached)
+        meta = {"queries": len(queries)}
+        if len(queries) > 1:
+            result = _scrape_fanout(pool, config, queries)
+        else:
+            result = _scrape_query(pool, queries[0])
+        if config.get("incremental") and isinstance(result, dict):
+            result = _finish_incremental(config, result, cached)
+        if pool.resource_policy.blocked:
+            print(f"资源拦截：累计拦截非必要资源请求 {pool.resource_policy.blocked} 个")
+            meta["blocked_resources"] = pool.resource_policy.blocked
+    finally:
+        if own_pool:
+            pool.close()
+
+    if isinstance(result, dict):
+        cells = report_api.find_best_cells(result)
+        result = InspectionResult(header=cells[0] if cells else [], rows=cells[1:])
+    result.meta.update(meta, records=len(result.rows))
+    return result
+
+
+def _flow_list(config: dict) -> list:
+    flow = config.get("integration_flow", "所有")
+    if not isinstance(flow, (list, tuple)):
+        return [flow]
+    flows = list(dict.fromkeys(f for f in flow if f))
+    # 选了“所有”就没有必要再逐个扇出
+    if not flows or "所有" in flows:
+        return ["所有"]
+    return flows
+
+
+def _date_shards(pool: BrowserPool, config: dict) -> list:
+    """
+    把较宽的日期区间切成按天（或按小时）的分片，每片单独查询以控制单次响应体积。
+    只在已有可回放模板时分片：首次查询整段走浏览器并记录模板，之后的同类查询才拆分并发。
+    """
+    shard_by = config.get("shard_by", "day")
+    start_date, end_date = config.get("start_date"), config.get("end_date")
+    if shard_by not in ("day", "hour") or not start_date or not end_date:
+        return [config]
+    try:
+        start = datetime.strptime(str(start_date)[:10], "%Y-%m-%d")
+        end = datetime.strptime(str(end_date)[:10], "%Y-%m-%d")
+    except ValueError:
+        return [config]
+    # 结束早于开始（向导不校验先后）时不分片，任何粒度都切不出分片
+    if end < start or (end == start and shard_by == "day"):
+        return [config]
+    if not _can_replay(pool, config):
+        return [config]
+
+    if shard_by == "hour" and not TemplateStore(config).get(config).date_has_time():
+        print("接口模板中的日期不含时间部分，按小时分片退化为按天分片")
+        shard_by = "day"
+
+    shards = []
+    day = start
+    while day <= end:
+        d = day.strftime("%Y-%m-%d")
+        if shard_by == "day":
+            shards.append(dict(config, start_date=d, end_date=d))
+        else:
+            shards.extend(dict(config, start_date=f"{d} {h:02d}:00:00", end_date=f"{d} {h:02d}:59:59")
+                          for h in range(24))
+        day += timedelta(days=1)
+    # 增量模式下开始时间可能精确到秒，首个分片保留原始起点
+    shards[0]["start_date"] = max(shards[0]["start_date"], str(start_date))
+    return shards
+
+
+def _split_queries(pool: BrowserPool, config: dict, cached: list) -> list:
+    """
+    按集成流 × 日期分片展开成若干个子查询。
+    开启增量模式时，先把每个流的查询收窄到上次的高水位之后，高水位之前的缓存行追加到 cached。
+    """
+    queries = []
+    for flow in _flow_list(config):
+        flow_config = dict(config, integration_flow=flow)
+        if config.get("incremental"):
+            flow_config = _narrow_incremental(pool, flow_config, cached)
+        queries.extend(_date_shards(pool, flow_config))
+    return queries
+
+
+def _narrow_incremental(pool: BrowserPool, config: dict, cached: list) -> dict:
+    with_time = _can_replay(pool, config) and TemplateStore(config).get(config).date_has_time()
+    narrowed = IncrementalStore(config).narrow(config, with_time)
+    if not narrowed:
+        return config
+    new_config, rows, header = narrowed
+    cached.append((header, rows))
+    print(f"[PROGRESS] 增量巡检：{config.get('integration_flow')} 复用缓存 {len(rows)} 条，仅查询 {new_config['start_date']} 之后的新日志", flush=True)
+    return new_config
+
+
+def _finish_incremental(config: dict, result: dict, cached: list) -> dict:
+    """把缓存行并回本次结果，并按流刷新高水位（有分片或分页没取到的流不刷新，下次重新查询这段时间）"""
+    payloads = [result] + [{"data": {"cells": [header] + rows}} for header, rows in cached if header]
+    merged = report_api.merge_payloads(payloads, dedupe=True)
+    incomplete = report_api.incomplete_flows(merged)
+    store = IncrementalStore(config)
+    for flow in _flow_list(config):
+        if str(flow) in incomplete or "所有" in incomplete:
+            print(f"增量巡检：{flow} 本次数据不完整，不更新高水位")
+            continue
+        header, rows = rows_for_flow(merged, flow)
+        if header:
+            store.save(dict(config, integration_flow=flow), header, rows)
+    return merged
+
+
+def _describe_query(config: dict) -> str:
+    parts = [str(config.get("integration_flow", "所有"))]
+    if config.get("start_date") or config.get("end_date"):
+        parts.append(f"{config.get('start_date') or ''}~{config.get('end_date') or ''}")
+    return " ".join(parts)
+
+
+def _scrape_query(pool: BrowserPool, config: dict):
+    """执行单个查询：优先读响应缓存，其次接口回放，最后驱动浏览器。返回响应 JSON (dict)，拿不到数据时返回 InspectionResult"""
+    # 缓存命中时直接返回，整个过程不启动浏览器
+    data = _cached_query(config)
+    if data is not None:
+        return data
+
+    # 已有同形状的接口模板与有效登录态时，直接走 HTTP 回放，完全绕开页面操作
+    if config.get("api_replay", True):
+        data = _replay_query(pool, config)
+        if data is not None:
+            return data
+
+    for attempt in range(2):
         try:
-            # 1. 打开登录页
-            url = config.get("url")
-            if not url:
-                raise ValueError("请在 config.json 或环境变量中配置 url")
-            page.goto(url, wait_until="networkidle")
-            
-            # 2. 登录流程
-            print("[PROGRESS] 系统登录中...")
-            
-            # 等待 iframe 元素出现
-            page.wait_for_selector("#yonbip_login_id, iframe[name='yonbip_login_id']", state="attached", timeout=30000)
-            
-            # 获取对应的 frame
-            login_frame = page.frame(name="yonbip_login_id")
-            if not login_frame:
-                raise Exception("无法找到名为 yonbip_login_id 的 iframe")
-                
-            # 检查是否有普通登录可点击
-            try:
-                if login_frame.locator("li#toNormalLogin").is_visible():
-                    login_frame.locator("li#toNormalLogin").click()
-            except Exception:
-                pass
-                
-            username = config.get("username")
-            password = config.get("password")
-            
-            if not username or not password:
-                raise ValueError("请在 config.json 或环境变量中配置 username 和 password")
-            
-            login_frame.locator("input#username").fill(username)
-            login_frame.locator("input#password").fill(password)
-            login_frame.locator("input#submit_btn_login").click()
-            
-            # 3. 进入系统主页并使用全局搜索
-            print("[PROGRESS] 登录成功，正在进入系统主页...")
-            search_input = page.locator("input.searchInput--1dPNm")
-            search_input.wait_for(state="visible", timeout=30000)
-            
-            print("[PROGRESS] 正在搜索‘华瑭接口集成流日志’功能...")
-            search_input.click()
-            search_input.fill("华瑭接口集成流日志")
-            
-            page.wait_for_timeout(2000)
-            page.keyboard.press("Enter")
-            
-            import time
-            print("寻找搜索结果并点击...")
-            clicked_result = False
-            start_time = time.time()
-            while time.time() - start_time < 60:
-                for frame in page.frames:
-                    try:
-                        loc = frame.get_by_text("华瑭接口集成流日志").last
-                        if loc.is_visible():
-                            loc.click()
-                            clicked_result = True
-                            break
-                    except:
-                        continue
-                if clicked_result:
-                    break
-                page.wait_for_timeout(1000)
-            
-            if not clicked_result:
-                raise Exception("等待60秒仍无法在任一 iframe 中找到搜索结果文本。")
-
-            # 4. 进入日志系统页
-            print("[PROGRESS] 已进入日志页面，正在按配置筛选目标数据...")
-            active_frame = None
-            start_time = time.time()
-            while time.time() - start_time < 60:
-                for frame in page.frames:
-                    try:
-                        flow_loc = frame.locator("label[title='集成流'] + div input")
-                        if flow_loc.count() > 0 and flow_loc.first.is_visible():
-                            active_frame = frame
-                            break
-                    except:
-                        continue
-                if active_frame:
-                    break
-                page.wait_for_timeout(1000)
-            
-            if not active_frame:
-                raise Exception("等待60秒仍无法在任一 iframe 中找到筛选输入框，加载超时。可能页面转圈时间过长。")
-            
-            # 等待确保主渲染区 iframe 加载完成后的动画/事件绑定
-            page.wait_for_timeout(3000)
-            
-            intercepted_data = None
-            def handle_route(route, request):
-                if "report/refresh" in request.url:
-                    current_url = request.url
-                    print(f"--- 捕捉到数据请求 URL: {current_url[:150]}...")
-                    
-                    # 尝试强制改写分页参数
-                    new_url = current_url
-                    if "currPageSize=" in current_url:
-                        # 替换现有的
-                        import re
-                        new_url = re.sub(r'currPageSize=\d+', 'currPageSize=1000', current_url)
-                    else:
-                        # 追加新的
-                        connector = "&" if "?" in current_url else "?"
-                        new_url = f"{current_url}{connector}currPageSize=1000"
-                    
-                    if new_url != current_url:
-                        print(f"--- 拦截成功：已将分页规模调整为 1000")
-                        route.continue_(url=new_url)
-                    else:
-                        route.continue_()
-                else:
-                    route.continue_()
-
-            def handle_response(response):
-                nonlocal intercepted_data
-                if "report/refresh" in response.url:
-                    status = response.status
-                    print(f"收到 API 响应 (HTTP {status}): {response.url[:80]}...")
-                    if status >= 400:
-                        print(f"警告：API 请求失败，状态码 {status}。可能是由于修改 URL 参数导致签名失效。")
-                        
-                    if "application/json" in response.headers.get("content-type", ""):
-                        try:
-                            # 只有成功响应才尝试获取 JSON
-                            if status == 200:
-                                data = response.json()
-                                # 只要包含 data 字段就视为潜在有效包
-                                if "data" in data:
-                                    intercepted_data = data
-                                    print(f"[PROGRESS] 抓包验证：成功拦截 API 数据包", flush=True)
-                        except Exception as e:
-                            print(f"解析 JSON 响应出错: {e}")
-            
-            page.route("**/*", handle_route)
-            page.on("response", handle_response)
-            
-            # --- 处理“创建时间”日期过滤 ---
-            start_date = config.get("start_date")
-            end_date = config.get("end_date")
-            if start_date or end_date:
-                try:
-                    date_inputs = active_frame.locator("label[title='创建时间'] + div input")
-                    if date_inputs.count() >= 2:
-                        def set_date_robustly(input_locator, date_str, label):
-                            input_locator.click()
-                            page.wait_for_timeout(300)
-                            # 全选并删除
-                            page.keyboard.press("Control+A")
-                            page.wait_for_timeout(100)
-                            page.keyboard.press("Backspace")
-                            page.wait_for_timeout(100)
-                            # 逐字输入或直接 type (type 比 fill 更能触发布发事件)
-                            input_locator.type(date_str, delay=50)
-                            page.wait_for_timeout(300)
-                            # 关键：必须回车以同步内部 UI State 到 “已选条件”
-                            page.keyboard.press("Enter")
-                            page.wait_for_timeout(500)
-                            print(f"[PROGRESS] 网页验证：已填写{label}日期 {date_str}", flush=True)
-
-                        if start_date:
-                            set_date_robustly(date_inputs.nth(0), start_date, "开始")
-                        if end_date:
-                            set_date_robustly(date_inputs.nth(1), end_date, "结束")
-                except Exception as e:
-                    print(f"处理创建时间出错: {e}")
-            
-            # --- 处理“集成流”过滤 ---
-            integration_flow = config.get("integration_flow", "所有")
+            data = _scrape_once(pool, config)
+            pool.save_state()
+            return data
+        except SessionExpired as e:
+            if attempt == 0:
+                print(f"[PROGRESS] 检测到登录态已过期（{e}），正在重新登录...", flush=True)
+                pool.invalidate(drop_state=True)
+                continue
+            return _record_scrape_failure(pool, config, e)
+        except Exception as e:
+            return _record_scrape_failure(pool, config, e)
+
+
+def _cached_query(config: dict):
+    """查询的所有分页都在响应缓存中时返回合并后的响应，否则返回 None"""
+    data = ResponseCache(config).get_query(config)
+    if data is not None:
+        print(f"[PROGRESS] 命中响应缓存（{_describe_query(config)}），无需重新抓取", flush=True)
+    return data
+
+
+def _can_replay(pool: BrowserPool, config: dict) -> bool:
+    return (config.get("api_replay", True) and os.path.exists(pool.state_path)
+            and TemplateStore(config).get(config) is not None)
+
+
+def _scrape_fanout(pool: BrowserPool, config: dict, queries: list):
+    """
+    子查询扇出：所有子查询共享同一份登录态，以接口回放的方式有界并发执行。
+    已在响应缓存中的子查询直接取用；还没有可回放的模板时，先用浏览器抓取第一个未命中的子查询（顺带记录模板），其余再并发回放；
+    回放失败的子查询在同一个浏览器会话中依次补抓。
+    """
+    concurrency = max(1, int(config.get("fanout_concurrency", 4)))
+    print(f"[PROGRESS] 本次巡检拆分为 {len(queries)} 个子查询（集成流/日期分片），并发度 {concurrency}...", flush=True)
+    results = {}
+    # 先查响应缓存：历史日期分片永久缓存，当天分片在 TTL 内有效
+    for i, query in enumerate(queries):
+        data = _cached_query(query)
+        if data is not None:
+            results[i] = data
+
+    pending = [i for i in range(len(queries)) if i not in results]
+    if pending and not _can_replay(pool, queries[pending[0]]):
+        results[pending[0]] = _scrape_query(pool, queries[pending[0]])
+
+    pending = [i for i in range(len(queries)) if i not in results]
+    if pending and _can_replay(pool, queries[pending[0]]):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            replayed = executor.map(carry_context(lambda i: _replay_query(pool, queries[i])), pending)
+            for i, data in zip(pending, replayed):
+                if data is not None:
+                    results[i] = data
+
+    # Playwright 同步 API 不能跨线程，浏览器兜底只能在当前线程依次执行
+    for i in range(len(queries)):
+        if i not in results:
+            results[i] = _scrape_query(pool, queries[i])
+
+    payloads = [results[i] for i in range(len(queries)) if isinstance(results[i], dict)]
+    failed = [_describe_query(queries[i]) for i in range(len(queries)) if not isinstance(results[i], dict)]
+    if failed:
+        print(f"[PROGRESS] ⚠️ 以下子查询未能获取到接口数据：{'、'.join(failed)}", flush=True)
+    if not payloads:
+        return results[0]
+    merged = report_api.merge_payloads(payloads, dedupe=True)
+    for i in range(len(queries)):
+        if not isinstance(results[i], dict):
+            report_api.mark_incomplete(merged, queries[i])
+    print(f"[PROGRESS] 子查询合并完成：{len(payloads)} 份结果去重后共 {max(len(report_api.find_best_cells(merged)) - 1, 0)} 条记录", flush=True)
+    return merged
+
+
+def _replay_query(pool: BrowserPool, config: dict):
+    template = TemplateStore(config).get(config)
+    if not template or not os.path.exists(pool.state_path):
+        return None
+    label = _describe_query(config)
+    try:
+        print(f"[PROGRESS] 命中已缓存的接口模板，直接请求后端 API（{label}，跳过浏览器）...", flush=True)
+        cookies = report_api.load_cookies(pool.state_path)
+        data = report_api.replay(template, config, cookies)
+        print(f"[PROGRESS] 抓包验证：接口回放成功获取 API 数据包（{label}）", flush=True)
+        return report_api.fetch_all_pages(data, template, config, cookies, ResponseCache(config))
+    except SessionExpired as e:
+        print(f"[PROGRESS] 接口回放登录态失效（{e}），改由浏览器重新登录抓取...", flush=True)
+    except Exception as e:
+        print(f"[PROGRESS] 接口回放失败（{e}），改由浏览器抓取...", flush=True)
+    return None
+
+
+def _record_scrape_failure(pool: BrowserPool, config: dict, e: Exception) -> InspectionResult:
+    page = pool.page
+    debug_files = []
+    try:
+        if page:
+            shot_path = output_path(config, "error_screenshot.png")
+            dom_path = output_path(config, "dom.txt")
+            page.screenshot(path=shot_path)
+            debug_files.append(shot_path)
+            with open(dom_path, "w", encoding="utf-8") as f:
+                f.write(page.content())
+            debug_files.append(dom_path)
+            print(f"已保存错误截图至 {shot_path}，DOM 至 {dom_path}")
+    except Exception as inner_e:
+        print(f"保存调试信息失败: {inner_e}")
+    # 页面状态未知，下次重新导航（登录态 Cookie 保留）
+    pool.invalidate()
+    print(f"网页抓取过程发生异常: {e}")
+    return InspectionResult(error=f"网页抓取失败: {e}", debug_files=debug_files)
+
+
+def _scrape_once(pool: BrowserPool, config: dict):
+    page, active_frame, fresh = pool.acquire()
+    print("[PROGRESS] 已进入日志页面，正在按配置筛选目标数据...")
+
+    intercepted_data = None
+    intercepted_request = None
+    page_size = int(config.get("page_size", 1000))
+    responses = []
+
+    def is_refresh_url(url):
+        return "report/refresh" in url
+
+    def handle_route(route, request):
+        current_url = request.url
+        print(f"--- 捕捉到数据请求 URL: {current_url[:150]}...")
+
+        # 尝试强制改写分页参数
+        new_url = report_api.with_page_size(current_url, page_size)
+
+        if new_url != current_url:
+            print(f"--- 拦截成功：已将分页规模调整为 {page_size}")
+            route.continue_(url=new_url)
+        else:
+            route.continue_()
+
+    def handle_response(response):
+        # 事件回调里只做登记，解析放到主流程，避免回调与等待逻辑交错
+        if is_refresh_url(response.url):
+            responses.append(response)
+
+    def read_response(response):
+        """校验并解析一次 report/refresh 响应，返回带 data 的 JSON；登录态失效时抛出 SessionExpired"""
+        status = response.status
+        print(f"收到 API 响应 (HTTP {status}): {response.url[:80]}...")
+        if status in (401, 403):
+            raise SessionExpired(f"数据接口返回 HTTP {status}")
+        if status >= 400:
+            print(f"警告：API 请求失败，状态码 {status}。可能是由于修改 URL 参数导致签名失效。")
+
+        if status == 200 and "application/json" in response.headers.get("content-type", ""):
             try:
-                flow_input = active_frame.locator("label[title='集成流'] + div").locator("input").first
-                flow_input.click()
-                page.wait_for_timeout(500)
-                
-                if integration_flow == "所有":
-                    flow_input.fill("")
-                    page.keyboard.press("Enter")
-                    page.wait_for_timeout(500)
-                else:
-                    flow_input.fill(integration_flow)
-                    page.wait_for_timeout(1000)
-                    
-                    # 尝试点击下拉选框内精确匹配的文本
-                    item_flow = active_frame.locator("li.wui-select-item").get_by_text(integration_flow, exact=True)
-                    if item_flow.count() > 0 and item_flow.first.is_visible():
-                        item_flow.first.click()
-                    else:
-                        # 兜底
-                        page.keyboard.press("Enter")
-                    page.wait_for_timeout(500)
+                # 直接按字节流解析，省去 response.json() 先整体解码成文本的一份拷贝
+                data = report_api.parse_payload(response.body())
+                # 只要包含 data 字段就视为潜在有效包
+                if "data" in data:
+                    print(f"[PROGRESS] 抓包验证：成功拦截 API 数据包", flush=True)
+                    return data
             except Exception as e:
-                print(f"处理集成流配置出错: {e}")
+                print(f"解析 JSON 响应出错: {e}")
+        return None
 
-            # 根据传入的动态参数设置需要抓取的状态，默认 2（全部）
-            target_status = str(config.get("status", "2"))
-            try:
-                status_input = active_frame.locator("label[title='状态'] + div").locator("input").first
-                status_input.click()
-                page.wait_for_timeout(500)
-                
-                if str(target_status) == "2":
-                    status_input.fill("")
-                    page.keyboard.press("Enter")
-                    page.wait_for_timeout(500)
-                else:
-                    status_input.fill(str(target_status))
-                    page.wait_for_timeout(500)
-                    
-                     # 精确获取状态项（由于可能有0, 1）避免选择错误
-                    item_st = active_frame.locator("li.wui-select-item").get_by_text(str(target_status), exact=True)
-                    if item_st.count() > 0 and item_st.first.is_visible():
-                        item_st.first.click()
-                    else:
-                        # 对于部分位于父级body的下拉框的特殊兼容
-                        item_st2 = page.locator("li.wui-select-item").get_by_text(str(target_status), exact=True)
-                        if item_st2.count() > 0 and item_st2.first.is_visible():
-                            item_st2.first.click()
-                        else:
-                            page.keyboard.press("Enter")
-                            
-                    page.wait_for_timeout(500)
-                    
-                # 在正式点击查询前，尝试从 UI 层面也拉满分页（双重保险）
-                try:
-                    # 寻找分页下拉框（通常在表格底部）
-                    pagination_selector = active_frame.locator("div.wui-select-selection").last
-                    if pagination_selector.count() > 0:
-                        pagination_selector.click()
-                        page.wait_for_timeout(500)
-                        # 尝试点击 1000 或 500
-                        option_1000 = active_frame.locator("li.wui-select-item").get_by_text("1000", exact=True)
-                        if option_1000.count() > 0:
-                            option_1000.first.click()
-                            print("[PROGRESS] UI 验证：已手动选择‘1000’分页", flush=True)
-                        else:
-                            # 尝试 500
-                            option_500 = active_frame.locator("li.wui-select-item").get_by_text("500", exact=True)
-                            if option_500.count() > 0:
-                                option_500.first.click()
-                                print("[PROGRESS] UI 验证：已手动选择‘500’分页", flush=True)
-                        page.wait_for_timeout(500)
-                except:
-                    pass
-
-                # 在点击之前重置历史数据抓包（避免读取到首次预加载包）
-                intercepted_data = None
-                print("[PROGRESS] 触发同步，正在请求后端 API 数据...")
+    # 只挂在数据接口上；其余请求交给上下文级的资源拦截策略处理
+    page.route(is_refresh_url, handle_route)
+    page.on("response", handle_response)
+    try:
+        _apply_filters(page, active_frame, config, fresh)
+
+        # 在点击之前重置历史数据抓包（避免读取到首次预加载包）
+        responses.clear()
+        print("[PROGRESS] 触发同步，正在请求后端 API 数据...")
+        deadline = time.time() + 60
+        try:
+            with page.expect_response(lambda r: is_refresh_url(r.url), timeout=60000):
                 active_frame.locator("button.button-search").click()
-            except Exception as e:
-                print(f"选择状态或查询出错: {e}")
-            
-            # 等待网络拦截对象填装
-            print("[PROGRESS] 数据传输中，正在获取全部分页结果...")
-            start_wait = time.time()
-            while time.time() - start_wait < 60:
+        except PlaywrightTimeoutError:
+            pass
+        except Exception as e:
+            print(f"选择状态或查询出错: {e}")
+
+        # 逐个检查到达的数据响应，直到拿到有效数据包或超时
+        print("[PROGRESS] 数据传输中，正在获取全部分页结果...")
+        checked = 0
+        while intercepted_data is None:
+            while checked < len(responses) and intercepted_data is None:
+                response = responses[checked]
+                checked += 1
+                intercepted_data = read_response(response)
                 if intercepted_data is not None:
-                    break
-                page.wait_for_timeout(500)
-                
-            if intercepted_data is None:
-                print("在 60 秒内未获取到 API 返回！抓取失败。正在生成截图...")
-                page.screenshot(path="error_screenshot.png", full_page=True)
-                
-                # 尝试最后的保底方案：直接抓取 DOM 表格
-                try:
-                    wt_holder = active_frame.locator("div.wtHolder")
-                    if wt_holder.count() > 0 and wt_holder.first.is_visible():
-                        logs_text = wt_holder.first.inner_text()
-                        print(f"成功进入保底方案：抓取到 DOM 文本 (约 {len(logs_text)} 字符)")
-                        return f"FALLBACK_TEXT:{logs_text}"
-                except:
-                    pass
-                    
-                return ""
-                
-            return json.dumps(intercepted_data, ensure_ascii=False)
-            
-            # 强制硬等待 8s，确保系统接口返回且表格完全重绘
-            # 如果不等待，会抓取到默认的“状态为 0”的旧日志
-            page.wait_for_timeout(8000)
-            
-            wt_holder = active_frame.locator("div.wtHolder")
-            if wt_holder.count() > 0 and wt_holder.first.is_visible():
-                logs_text = wt_holder.first.inner_text()
-            else:
-                logs_text = "未找到包裹日志的容器 wtHolder，可能今日无数据或页面结构有变。"
-            
-            print(f"抓取到日志内容长度: {len(logs_text)}")
-            return logs_text
+                    intercepted_request = response.request
+            remaining = deadline - time.time()
+            if intercepted_data is not None or remaining <= 0:
+                break
+            try:
+                page.wait_for_event("response", lambda r: is_refresh_url(r.url), timeout=remaining * 1000)
+            except PlaywrightTimeoutError:
+                break
 
-        except Exception as e:
+        if intercepted_data is None and page.frame(name="yonbip_login_id"):
+            raise SessionExpired("页面被重定向到登录页")
+
+        if intercepted_data is None:
+            print("在 60 秒内未获取到 API 返回！抓取失败。正在生成截图...")
+            shot_path = output_path(config, "error_screenshot.png")
+            page.screenshot(path=shot_path, full_page=True)
+
+            # 尝试最后的保底方案：直接抓取 DOM 表格
             try:
-                page.screenshot(path="error_screenshot.png")
-                with open("dom.txt", "w", encoding="utf-8") as f:
-                    f.write(page.content())
-                print("已保存错误截图至 error_screenshot.png，DOM 至 dom.txt")
-            except Exception as inner_e:
-                print(f"保存调试信息失败: {inner_e}")
-            print(f"网页抓取过程发生异常: {e}")
-            return f"网页抓取失败: {e}"
-            
-        finally:
-            browser.close()
+                wt_holder = active_frame.locator("div.wtHolder")
+                if wt_holder.count() > 0 and wt_holder.first.is_visible():
+                    logs_text = wt_holder.first.inner_text()
+                    print(f"成功进入保底方案：抓取到 DOM 文本 (约 {len(logs_text)} 字符)")
+                    return InspectionResult(fallback_text=logs_text, debug_files=[shot_path])
+            except:
+                pass
+
+            return InspectionResult(debug_files=[shot_path])
+
+        template = _save_report_template(intercepted_request, config)
+        # 超过单页上限时，携带浏览器当前登录态直接回放请求补齐剩余分页
+        pool.save_state()
+        cookies = report_api.load_cookies(pool.state_path)
+        return report_api.fetch_all_pages(intercepted_data, template, config, cookies, ResponseCache(config))
+    finally:
+        # 页面会被复用，必须摘掉本次挂载的拦截器，防止重复处理
+        try:
+            page.unroute(is_refresh_url, handle_route)
+            page.remove_listener("response", handle_response)
+        except Exception:
+            pass
 
 
-def process_and_save_data(logs_text: str, config: dict):
+def _save_report_template(request, config: dict) -> ReportTemplate:
+    """
+    把本次成功的 report/refresh 请求记录为模板，后续同形状查询可直接回放。
+    返回可用于本次翻页的模板（条件无法定位时退化为原样快照）。
+    """
+    # route.continue_ 改写过的 URL 不一定反映在 request.url 上，这里按同样规则补齐分页规模
+    url = report_api.with_page_size(request.url, int(config.get("page_size", 1000)))
+    raw = ReportTemplate.raw(url, request.method, request.headers, request.post_data)
+    if not config.get("api_replay", True):
+        return raw
+    try:
+        template = ReportTemplate.capture(url, request.method, request.headers,
+                                          request.post_data, config)
+        if template:
+            TemplateStore(config).put(config, template)
+            print(f"已记录接口模板（{report_api.query_shape(config)}），后续同类查询将直接回放")
+            return template
+    except Exception as e:
+        print(f"记录接口模板失败: {e}")
+    return raw
+
+
+def _pick_dropdown_item(page, active_frame, text: str, timeout: int = 3000) -> bool:
+    """等待下拉框中出现精确匹配的选项并点击；部分下拉框渲染在父级 body 中，一并兼容"""
+    item = active_frame.locator("li.wui-select-item").get_by_text(text, exact=True)
+    try:
+        item.first.wait_for(state="visible", timeout=timeout)
+        item.first.click()
+        return True
+    except PlaywrightTimeoutError:
+        pass
+    item = page.locator("li.wui-select-item").get_by_text(text, exact=True)
+    if item.count() > 0 and item.first.is_visible():
+        item.first.click()
+        return True
+    return False
+
+
+def _apply_filters(page, active_frame, config: dict, fresh: bool):
+    # --- 处理“创建时间”日期过滤 ---
+    start_date = config.get("start_date")
+    end_date = config.get("end_date")
+    # 复用的页面上残留着上一次的日期条件，本次未指定时需要清空
+    if start_date or end_date or not fresh:
+        try:
+            date_inputs = active_frame.locator("label[title='创建时间'] + div input")
+            if date_inputs.count() >= 2:
+                def set_date_robustly(input_locator, date_str, label):
+                    input_locator.click()
+                    # 全选并删除
+                    page.keyboard.press("Control+A")
+                    page.keyboard.press("Backspace")
+                    # 逐字输入或直接 type (type 比 fill 更能触发布发事件)
+                    if date_str:
+                        input_locator.type(date_str)
+                    # 关键：必须回车以同步内部 UI State 到 “已选条件”
+                    page.keyboard.press("Enter")
+                    # 以输入框的值为准确认日期已被组件接收，而不是固定等待
+                    expected = re.compile("^" + re.escape(date_str)) if date_str else ""
+                    try:
+                        expect(input_locator).to_have_value(expected, timeout=3000)
+                    except AssertionError:
+                        print(f"警告：{label}日期输入框的值未同步为 {date_str!r}")
+                    if date_str:
+                        print(f"[PROGRESS] 网页验证：已填写{label}日期 {date_str}", flush=True)
+
+                if start_date or not fresh:
+                    set_date_robustly(date_inputs.nth(0), start_date, "开始")
+                if end_date or not fresh:
+                    set_date_robustly(date_inputs.nth(1), end_date, "结束")
+        except Exception as e:
+            print(f"处理创建时间出错: {e}")
+
+    # --- 处理“集成流”过滤 ---
+    integration_flow = config.get("integration_flow", "所有")
+    try:
+        flow_input = active_frame.locator("label[title='集成流'] + div").locator("input").first
+        flow_input.click()
+
+        if integration_flow == "所有":
+            flow_input.fill("")
+            page.keyboard.press("Enter")
+        else:
+            flow_input.fill(integration_flow)
+            # 等待下拉框内出现精确匹配的文本并点击，超时则兜底回车
+            if not _pick_dropdown_item(page, active_frame, integration_flow):
+                page.keyboard.press("Enter")
+    except Exception as e:
+        print(f"处理集成流配置出错: {e}")
+
+    # 根据传入的动态参数设置需要抓取的状态，默认 2（全部）
+    target_status = str(config.get("status", "2"))
+    try:
+        status_input = active_frame.locator("label[title='状态'] + div").locator("input").first
+        status_input.click()
+
+        if str(target_status) == "2":
+            status_input.fill("")
+            page.keyboard.press("Enter")
+        else:
+            status_input.fill(str(target_status))
+            # 精确获取状态项（由于可能有0, 1）避免选择错误
+            if not _pick_dropdown_item(page, active_frame, str(target_status)):
+                page.keyboard.press("Enter")
+
+        # 在正式点击查询前，尝试从 UI 层面也拉满分页（双重保险）
+        try:
+            # 寻找分页下拉框（通常在表格底部）
+            pagination_selector = active_frame.locator("div.wui-select-selection").last
+            if pagination_selector.count() > 0:
+                pagination_selector.click()
+                options = active_frame.locator("li.wui-select-item")
+                options.first.wait_for(state="visible", timeout=1500)
+                # 尝试点击 1000 或 500
+                for option in ("1000", "500"):
+                    item = options.get_by_text(option, exact=True)
+                    if item.count() > 0:
+                        item.first.click()
+                        print(f"[PROGRESS] UI 验证：已手动选择‘{option}’分页", flush=True)
+                        break
+        except:
+            pass
+    except Exception as e:
+        print(f"选择状态或查询出错: {e}")
+
+
+def process_and_save_data(result: InspectionResult, config: dict) -> InspectionResult:
+    """
+    清洗抓取结果并生成报表（默认 error_logs.txt / error_logs.xlsx）与 report_summary.md，结果回填到 result 中。
+    文件写在 output_dir 下（未配置时为当前目录），并发的任务各用各的目录，互不覆盖。
+    """
+    formats = config.get("export_formats") or DEFAULT_FORMATS
+    report_base = output_path(config, "error_logs")
+    summary_path = output_path(config, "report_summary.md")
+    result.output_dir = config.get("output_dir") or ""
     # ================= 1. 清理旧文件 =================
     # 每次开始处理前，先强制删除旧文件，防止程序中途报错导致发送上一次的“幽灵文件”
-    for old_file in ["error_logs.txt", "error_logs.xlsx", "report_summary.md"]:
+    for old_file in export_paths(report_base, list(EXTENSIONS)) + [summary_path]:
         if os.path.exists(old_file):
             try:
                 os.remove(old_file)
@@ -351,214 +593,85 @@ def process_and_save_data(logs_text: str, config: dict):
 
     def save_empty_result(msg):
         df_empty = pd.DataFrame([{"巡检结果": msg}])
-        df_empty.to_csv("error_logs.txt", sep='\t', index=False, encoding='utf-8-sig')
-        df_empty.to_excel("error_logs.xlsx", index=False)
+        files = export_report(df_empty, report_base, formats)
 
         # 👇 补上这三行：生成全绿色的成功卡片文案
-        with open("report_summary.md", "w", encoding="utf-8") as f:
-            f.write(f"🎉 **系统运行平稳，未发现异常。**\n\n*(附加说明：{msg})*")
+        summary = f"🎉 **系统运行平稳，未发现异常。**\n\n*(附加说明：{msg})*"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(summary)
 
+        result.message = msg
+        result.summary = summary
+        result.files = files + [summary_path]
         print(f"[PROGRESS] 提示：{msg}。已为您生成说明文件。", flush=True)
-
-    if not logs_text or logs_text.strip() == "":
-        save_empty_result("没有抓取到异常日志或对应结构为空")
-        return
+        return result
 
     # ================= 2. 识别数据类型 =================
-    if logs_text.startswith("网页抓取失败:"):
-        save_empty_result(f"浏览器端拦截数据时发生错误, 详情参见日志截屏")
-        return
+    if result.error:
+        return save_empty_result(f"浏览器端拦截数据时发生错误, 详情参见日志截屏")
 
-    if logs_text.startswith("FALLBACK_TEXT:"):
-        raw_text = logs_text.replace("FALLBACK_TEXT:", "")
-        lines = [l.strip() for l in raw_text.split('\n') if l.strip()]
+    if result.fallback_text is not None:
+        lines = [l.strip() for l in result.fallback_text.split('\n') if l.strip()]
         if not lines:
-            save_empty_result("进入了保底方案，但页面上未找到任何文本内容")
-            return
+            return save_empty_result("进入了保底方案，但页面上未找到任何文本内容")
 
         df = pd.DataFrame(lines, columns=["原始数据行(保底方案输出)"])
-        df.to_csv("error_logs.txt", sep='\t', index=False, encoding='utf-8-sig')
-        df.to_excel("error_logs.xlsx", index=False)
+        result.files = export_report(df, report_base, formats)
+        result.df = df
+        result.message = "API 拦截失败，导出的是页面可见部分的原始文本（保底方案）"
         print("[PROGRESS] ✅ 注意：由于 API 拦截失败，当前导出的是页面可见部分的原始文本（保底方案）。")
-        return
+        return result
+
+    if not result.header:
+        return save_empty_result("没有抓取到异常日志或对应结构为空")
 
     print("\n=== 成功拦截到 API 数据，正在提取并处理... ===")
     try:
-        data = json.loads(logs_text)
-    except Exception as e:
-        save_empty_result(f"数据解析失败，返回的不是合法的 JSON 格式")
-        return
+        # ================= 3. 提取表格 =================
+        if not result.rows:
+            return save_empty_result("返回的数据结构中未找到可用的表格数据或数据为空")
 
-    try:
-        # ================= 3. 解析 JSON 树 =================
-        def find_best_cells(obj):
-            best_cells = []
-            if isinstance(obj, dict):
-                if 'cells' in obj and isinstance(obj['cells'], list):
-                    if len(obj['cells']) > len(best_cells):
-                        best_cells = obj['cells']
-                for k, v in obj.items():
-                    res = find_best_cells(v)
-                    if len(res) > len(best_cells):
-                        best_cells = res
-            elif isinstance(obj, list):
-                for item in obj:
-                    res = find_best_cells(item)
-                    if len(res) > len(best_cells):
-                        best_cells = res
-            return best_cells
-
-        cells = find_best_cells(data)
-
-        if not cells or len(cells) < 2:
-            save_empty_result("返回的数据结构中未找到可用的表格数据或数据为空")
-            return
-
-        headers = []
-        header_row = cells[0]
-        for col in header_row:
-            if isinstance(col, list) and len(col) > 5:
-                headers.append(str(col[0]))
-            elif isinstance(col, dict) and 'v' in col:
-                headers.append(str(col['v']))
-            else:
-                headers.append(str(col))
-
-        extracted = []
-        for row in cells[1:]:
-            row_data = []
-            for col in row:
-                if isinstance(col, list) and len(col) > 5:
-                    row_data.append(str(col[0]))
-                elif isinstance(col, dict) and 'v' in col:
-                    row_data.append(str(col['v']))
-                else:
-                    if col is None:
-                        row_data.append('')
-                    else:
-                        row_data.append(str(col))
-            extracted.append(row_data)
-
-        if not extracted:
-            save_empty_result("JSON 数据提取完成，但未发现任何行级原始日志记录")
-            return
+        # 按列抽取并批量规范化为纯文本（抹平数字与浮点数的 .0 尾巴），不再逐格判断类型
+        columns = report_api.table_columns(result.header, result.rows)
 
         # ================= 4. 初始化 DataFrame =================
-        df = pd.DataFrame(extracted, columns=headers)
+        df = pd.DataFrame(columns)
         print(f"--- 调试信息：原始抓取到 {len(df)} 条记录 ---")
-
-        # 🚨 核心修复1：剔除重复列名与垃圾列（解决 'str' 报错问题）
-        df = df.loc[:, ~df.columns.duplicated()]
-        df = df.loc[:, ~df.columns.isin(['', 'None', 'nan', 'NaN'])]
+        if config.get("compact_dtypes", True):
+            df = compact_dtypes(df)
 
         # ================= 5. 数据深度清洗 =================
-        # 🚨 核心修复2：降维打击，强制全表转为纯字符串，抹平数字与浮点数
-        for col in df.columns:
-            df[col] = df[col].fillna('').astype(str).str.strip()
-            # 清理 Pandas 误认整数为浮点数带入的 .0 尾巴
-            if df[col].str.endswith('.0').any():
-                df[col] = df[col].str.replace(r'\.0$', '', regex=True)
-
-        # 移除无用列
-        cols_to_drop = [c for c in ['主键', '编码'] if c in df.columns]
-        if cols_to_drop:
-            df.drop(columns=cols_to_drop, inplace=True)
-
-        # 白名单过滤
-        whitelist = config.get("whitelist", [])
-        msg_col = next((c for c in df.columns if '消息' in c), None)
-        if whitelist and msg_col:
-            pre_len = len(df)
-            for w in whitelist:
-                df = df[~df[msg_col].str.contains(w, na=False, regex=False)]
-            dropped = pre_len - len(df)
-            if dropped > 0:
-                print(f"[PROGRESS] 🧹 白名单过滤：命中排除词汇，剔除 {dropped} 条，剩余 {len(df)} 条", flush=True)
-
-        # 专属屏蔽：“华夏”相关集成流直接强制抛弃
-        flow_col = next((c for c in df.columns if '集成流' in c), None)
-        if flow_col and not df.empty:
-            pre_len = len(df)
-            df = df[~df[flow_col].str.contains("华夏", na=False, regex=False)]
-            dropped = pre_len - len(df)
-            if dropped > 0:
-                print(f"[PROGRESS] 🧹 系统过滤：强制屏蔽“华厦”相关流，剔除 {dropped} 条，剩余 {len(df)} 条", flush=True)
-
-        # 日期区间过滤
-        time_col = next((c for c in df.columns if '创建时间' in c), None)
-        if time_col and not df.empty:
-            start_date = config.get("start_date")
-            end_date = config.get("end_date")
-            if start_date or end_date:
-                pre_len = len(df)
-                df_dates = pd.to_datetime(df[time_col], errors='coerce')
-
-                if start_date:
-                    s_date = pd.to_datetime(str(start_date))
-                    df = df[df_dates >= s_date]
-                    df_dates = df_dates[df_dates >= s_date]
-
-                if end_date:
-                    e_date = pd.to_datetime(str(end_date)).replace(hour=23, minute=59, second=59)
-                    df = df[df_dates <= e_date]
-                    
-                dropped = pre_len - len(df)
-                if dropped > 0:
-                    print(f"[PROGRESS] 🧹 日期过滤：剔除超出范围记录 {dropped} 条，剩余 {len(df)} 条", flush=True)
-
-        # 第一重去重：全局报文去重。必须放在剔除状态之前。
-        # 这样如果同一条报文重复请求，且最后一次是成功的(0)，该成功的0会存留并干掉历史的报错(1)
-        # 随后紧跟的状态清道夫再去清理0，就能把这种“已自愈”的报错斩草除根。
-        dup_columns = []
-        for col_kw in ['集成流', '请求报文']:
-            found_col = next((c for c in df.columns if col_kw in c), None)
-            if found_col:
-                dup_columns.append(found_col)
-
-        if dup_columns and time_col and not df.empty:
-            pre_len = len(df)
-            df = df.sort_values(by=dup_columns + [time_col], ascending=[True] * len(dup_columns) + [False])
-            df = df.drop_duplicates(subset=dup_columns, keep='first')
-            dropped = pre_len - len(df)
-            print(f"[PROGRESS] 🧹 时序去重：合并重复重试报文 {dropped} 条，剩余 {len(df)} 条", flush=True)
-
-        # 状态过滤：强制剔除所有成功的请求记录 (0)，无论前端拉取了什么
-        status_col = next((c for c in df.columns if '状态' in c), None)
-        if status_col and not df.empty:
-            pre_len = len(df)
-            # 保留所有去除空格后 != '0' 和 != '0.0' 的记录，绝对防漏
-            df = df[~df[status_col].astype(str).str.strip().isin(['0', '0.0'])]
-            dropped = pre_len - len(df)
-            print(f"[PROGRESS] 🧹 状态清洗：强制剔除成功记录 {dropped} 条，剩余 {len(df)} 条报错", flush=True)
-
-        # 消息相似度去重 (用正则将动态数字全变为 '*')
-        dup_columns_msg = []
-        for col_kw in ['集成流', '消息']:
-            found_col = next((c for c in df.columns if col_kw in c), None)
-            if found_col:
-                dup_columns_msg.append(found_col)
-
-        if dup_columns_msg and time_col and not df.empty:
-            pre_len = len(df)
-            df['_clean_msg'] = df[dup_columns_msg[1]].str.replace(r'\d+', '*', regex=True)
-            sort_cols = [dup_columns_msg[0], '_clean_msg', time_col]
-            df = df.sort_values(by=sort_cols, ascending=[True, True, False])
-            df = df.drop_duplicates(subset=[dup_columns_msg[0], '_clean_msg'], keep='first')
-            df.drop(columns=['_clean_msg'], inplace=True)
-            dropped = pre_len - len(df)
-            if dropped > 0:
-                print(f"[PROGRESS] 🧹 掩码去重：合并同类项噪音 {dropped} 条，最终剩余 {len(df)} 条报错清单", flush=True)
+        # 按 filter_rules 配置的规则依次清洗（默认规则即原先写死的白名单、华夏屏蔽、日期、去重与状态清洗）
+        pipeline = FilterPipeline(config.get("filter_rules") or DEFAULT_FILTER_RULES, config)
+        df, stats = pipeline.run(df)
+        result.meta["filter_stats"] = stats
+        for stat in stats:
+            if stat["removed"] > 0:
+                print(f"[PROGRESS] 🧹 {stat['name']}：剔除 {stat['removed']} 条，剩余 {stat['rows_out']} 条", flush=True)
+            if stat.get("hits"):
+                print(f"{stat['name']}命中统计：" + "，".join(f"{t} × {n}" for t, n in sorted(stat["hits"].items(), key=lambda x: -x[1])))
+        print("过滤规则耗时：" + "，".join(f"{s['name']} {s['seconds'] * 1000:.1f}ms" for s in stats))
 
         # ================= 6. 最终排序与保存 =================
+        time_col = find_column(df, '创建时间')
         if time_col and not df.empty:
             df = df.sort_values(by=time_col, ascending=False)
 
         if df.empty:
-            save_empty_result("经过白名单消息和日期深度过滤后，当前时间段内无符合条件的报错")
-            return
+            return save_empty_result("经过白名单消息和日期深度过滤后，当前时间段内无符合条件的报错")
 
         print(f"\n[PROGRESS] ✅ 过滤完成！最终留存的报错记录条数: {len(df)} 条\n", flush=True)
 
+        # 追加到历史库，供趋势统计与事后查询（python history_store.py --help）
+        history = None
+        if config.get("history", True):
+            try:
+                history = HistoryStore(config)
+                result.meta["history_added"] = history.append(df, config)
+            except Exception as e:
+                print(f"写入巡检历史库失败: {e}")
+                history = None
+
         # ================= 7. 生成移动端直推富文本摘要战报 =================
         try:
             flow_col = next((c for c in df.columns if '集成流' in c), None)
@@ -569,6 +682,9 @@ def process_and_save_data(logs_text: str, config: dict):
             report_lines.append("🚨 **日志巡检异常战报**")
             report_lines.append(f"🕒 巡检时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             report_lines.append(f"📊 总计抓获真实报错：**{len(df)}** 条")
+            trend = history.trend_line(7) if history else ""
+            if trend:
+                report_lines.append(trend)
             report_lines.append("──────────────")
             
             if flow_col and msg_col and time_col_final:
@@ -596,8 +712,10 @@ def process_and_save_data(logs_text: str, config: dict):
             report_lines.append("💡 *详细全量排查请查收随后的 Excel 附件。*")
             
             summary_text = "\n".join(report_lines)
-            with open("report_summary.md", "w", encoding="utf-8") as rf:
+            with open(summary_path, "w", encoding="utf-8") as rf:
                 rf.write(summary_text)
+            result.summary = summary_text
+            result.files.append(summary_path)
             
             # 使用特定前缀让服务端知道需要提取整段作为 Markdown 发送
             print(f"[PROGRESS] ✅ 生成简报完成，已准备卡片投递...", flush=True)
@@ -605,15 +723,36 @@ def process_and_save_data(logs_text: str, config: dict):
         except Exception as e:
             print(f"生成摘要战报时出错: {e}")
 
-        # 写入 txt 时使用 utf-8-sig，防止在 Windows 系统中乱码
-        df.to_csv("error_logs.txt", sep='\t', index=False, encoding='utf-8-sig')
-        df.to_excel("error_logs.xlsx", index=False)
+        # 各格式并发、流式写出（xlsx 使用常量内存模式）
+        result.files[:0] = export_report(df, report_base, formats)
+        result.df = df
+        result.message = f"最终留存的报错记录 {len(df)} 条"
         print("[PROGRESS] 巡检处理成功！已生成干净的 Excel 报表...")
 
     except Exception as e:
         print(f"处理或保存异常日志时出错: {e}")
+        result.error = f"处理或保存异常日志时出错: {e}"
+    return result
+
+
+def run_inspection(params: dict = None, pool: BrowserPool = None, output_dir: str = None) -> InspectionResult:
+    """
+    可直接 import 调用的巡检入口：在 config.json（及 DYNAMIC_PARAMS）的基础上叠加 params，
+    抓取、清洗并生成报表，返回 InspectionResult。传入长驻的 BrowserPool 可复用浏览器与登录态；
+    传入 output_dir 时报表、摘要与调试截图都写到该目录（不存在则创建），否则写在当前目录。
+    """
+    config = load_config()
+    config.update(params or {})
+    output_dir = output_dir or config.get("output_dir")
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        config["output_dir"] = output_dir
+    started = time.time()
+    result = scrape_logs(config, pool)
+    process_and_save_data(result, config)
+    result.meta["elapsed"] = round(time.time() - started, 2)
+    return result
 
 if __name__ == "__main__":
-    config_dict = load_config()
-    logs = scrape_logs(config_dict)
-    process_and_save_data(logs, config_dict)
+    with BrowserPool(load_config()) as browser_pool:
+        run_inspection(pool=browser_pool)
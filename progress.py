@@ -0,0 +1,153 @@
+import io
+import sys
+import time
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 当前执行上下文（一个巡检任务）的输出接收器；线程池中的子任务通过 carry_context 继承
+_sink = contextvars.ContextVar("progress_sink", default=None)
+_install_lock = threading.Lock()
+
+
+class _LineSink:
+    """把零散写入的文本拼成整行后回调，多个线程写同一个任务时加锁"""
+
+    def __init__(self, on_line):
+        self.on_line = on_line
+        self.buffer = ""
+        self.lock = threading.Lock()
+
+    def feed(self, text: str):
+        with self.lock:
+            self.buffer += text
+            if "\n" not in self.buffer:
+                return
+            *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self._emit(line)
+
+    def close(self):
+        with self.lock:
+            rest, self.buffer = self.buffer, ""
+        self._emit(rest)
+
+    def _emit(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        # 回调内部的 print 只写终端，不再回流到本接收器
+        token = _sink.set(None)
+        try:
+            self.on_line(line)
+        except Exception as e:
+            sys.__stderr__.write(f"处理进度输出失败: {e}\n")
+        finally:
+            _sink.reset(token)
+
+
+class _StdoutRouter(io.TextIOBase):
+    """替换 sys.stdout：输出照常写到原始终端，当前上下文登记了接收器时再按行转交给它"""
+
+    def __init__(self, target):
+        self.target = target
+
+    def write(self, text):
+        self.target.write(text)
+        sink = _sink.get()
+        if sink is not None:
+            sink.feed(text)
+        return len(text)
+
+    def flush(self):
+        self.target.flush()
+
+    @property
+    def encoding(self):
+        return getattr(self.target, "encoding", "utf-8")
+
+
+def _install():
+    with _install_lock:
+        if not isinstance(sys.stdout, _StdoutRouter):
+            sys.stdout = _StdoutRouter(sys.stdout)
+
+
+@contextmanager
+def capture_output(on_line):
+    """
+    在 with 块内（含通过 carry_context 提交到线程池的子任务）把 print 的每一行交给 on_line。
+    用于长驻服务在进程内执行巡检时，替代原先逐行读取子进程 stdout 的方式；各任务的输出互不串线。
+    """
+    _install()
+    sink = _LineSink(on_line)
+    token = _sink.set(sink)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
+        sink.close()
+
+
+def carry_context(fn):
+    """包装提交到线程池的函数，使其在提交方的上下文副本中运行（进度输出仍归属同一个任务）"""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+_CLOSE = object()
+
+
+class ProgressChannel:
+    """
+    推送到 IM 的进度通道：push 只把行放进队列立即返回，由独立的后台线程按时间窗口攒批后调用 send(lines)。
+    - 第一行到达后再等 window 秒，把期间产生的行合并成一条消息；
+    - 两次发送至少间隔 min_interval 秒，避免触发飞书/企微的频率限制；
+    - 巡检线程永远不会被缓慢的 IM 接口阻塞。close 时立即发出剩余的行。
+    对应配置项 progress：{"window": 1.5, "min_interval": 1.0}
+    """
+
+    def __init__(self, send, config: dict = None):
+        conf = (config or {}).get("progress", {})
+        self.window = float(conf.get("window", 1.5))
+        self.min_interval = float(conf.get("min_interval", 1.0))
+        self.send = send
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="progress-channel", daemon=True)
+        self._thread.start()
+
+    def push(self, line: str):
+        self._queue.put(line)
+
+    def close(self, timeout: float = 30):
+        """发出尚未推送的行并等待后台线程结束（最多 timeout 秒）"""
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+
+    def _loop(self):
+        last_sent = 0.0
+        closing = False
+        while not closing:
+            item = self._queue.get()
+            if item is _CLOSE:
+                return
+            batch = [item]
+            deadline = max(time.time() + self.window, last_sent + self.min_interval)
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _CLOSE:
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                self.send(batch)
+            except Exception as e:
+                print(f"推送进度消息失败: {e}")
+            last_sent = time.time()
@@ -0,0 +1,828 @@
+import os
+import re
+import json
+import codecs
+import copy
+import math
+import operator
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from browser_pool import SessionExpired
+from progress import carry_context
+
+# 参与回放替换的查询条件；未设置的条件（状态=2、集成流=所有、无日期）在前端表现为空值，无法定位
+QUERY_FIELDS = ("start_date", "end_date", "status", "integration_flow")
+DATE_FIELDS = ("start_date", "end_date")
+# 分页相关键名不参与条件替换，避免把 status=1 误写到页码上
+PAGING_KEYS = {"currpage", "currpagesize", "pageindex", "pagesize", "pagenum", "page", "pageno"}
+# 分页请求中表示“第几页”的参数名（小写比较），以及响应中表示总条数的键名
+PAGE_INDEX_KEYS = ("currpage", "pageindex", "pagenum", "pageno")
+TOTAL_COUNT_KEYS = ("totalCount", "total", "recordCount", "totalRecords", "totalNum")
+# 合并后的响应中记录“数据不完整”（有分页或子查询没取到）的集成流，增量模式据此不推进这些流的高水位
+INCOMPLETE_KEY = "_incomplete_flows"
+# 重放时丢弃的请求头：由 requests 自行生成或会与 Cookie 冲突
+DROP_HEADERS = {"cookie", "content-length", "host", "connection", "accept-encoding"}
+# 请求中出现的日期字面量；未绑定到任何查询条件的日期回放时不会更新，会一直查询旧日期
+DATE_LITERAL = re.compile(r"\d{4}[-/]\d{1,2}[-/]\d{1,2}")
+
+
+def with_page_size(url: str, page_size: int) -> str:
+    """把 URL 中的 currPageSize 改写（或追加）为指定的分页规模"""
+    if "currPageSize=" in url:
+        return re.sub(r'currPageSize=\d+', f'currPageSize={page_size}', url)
+    connector = "&" if "?" in url else "?"
+    return f"{url}{connector}currPageSize={page_size}"
+
+
+def query_values(config: dict) -> dict:
+    """提取本次查询中“真正生效”的条件值（与前端筛选框的填写逻辑保持一致）"""
+    values = {}
+    for field in DATE_FIELDS:
+        if config.get(field):
+            values[field] = str(config[field])
+    status = str(config.get("status", "2"))
+    if status != "2":
+        values["status"] = status
+    flow = config.get("integration_flow", "所有")
+    if flow and flow != "所有":
+        values["integration_flow"] = str(flow)
+    return values
+
+
+def query_shape(config: dict) -> str:
+    """同一组“已设置条件”的查询共享一个模板，例如 start_date+end_date+status"""
+    values = query_values(config)
+    return "+".join(f for f in QUERY_FIELDS if f in values) or "default"
+
+
+def _date_pattern(date_str: str):
+    # 匹配日期本身以及前端可能追加的时间部分（2026-02-12 00:00:00）
+    return re.compile(re.escape(date_str) + r"( \d{2}:\d{2}(:\d{2})?)?")
+
+
+def _replace_dates(text: str, edits: list) -> str:
+    """
+    按 [(旧日期, 新日期, 第几次出现), ...] 一次性替换 text 中的日期；new 自带时间时整体替换，否则保留原有时间后缀。
+    所有位置都在原始文本上定位后再统一替换——逐条替换时前一条写入的新日期会打乱后一条的出现序号，
+    例如开始、结束日期同在一个值里（“2026-02-17 00:00:00,2026-02-17 23:59:59”）时结束日期会被漏掉。
+    """
+    spans = []
+    for old, new, occurrence in edits:
+        for idx, m in enumerate(_date_pattern(old).finditer(text)):
+            if occurrence is None or idx == occurrence:
+                spans.append((m.start(), m.end(), new if " " in new else new + (m.group(1) or "")))
+    out, pos = [], 0
+    for start, end, replacement in sorted(spans):
+        if start < pos:
+            continue
+        out.append(text[pos:start])
+        out.append(replacement)
+        pos = end
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def _json_leaves(obj):
+    """按文档顺序遍历 JSON 中的标量叶子，返回 (路径列表, 值)"""
+    stack = [((), obj)]
+    while stack:
+        path, node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend((path + (k,), v) for k, v in reversed(list(node.items())))
+        elif isinstance(node, list):
+            stack.extend((path + (i,), v) for i, v in reversed(list(enumerate(node))))
+        elif isinstance(node, (str, int, float)) and not isinstance(node, bool):
+            yield list(path), node
+
+
+class ReportTemplate:
+    """
+    一次成功的 report/refresh 请求快照（URL、请求头、请求体），以及各查询条件在其中的位置。
+    位置 (slot) 形如 {"where": "url"|"form"|"json", "key": 参数名或 JSON 路径, "occurrence": 第几次出现}。
+    """
+
+    def __init__(self, url, method, headers, body, values, slots):
+        self.url = url
+        self.method = method
+        self.headers = headers
+        self.body = body
+        self.values = values
+        self.slots = slots
+
+    # ================= 捕获 =================
+    @classmethod
+    def raw(cls, url, method, headers, body):
+        """不定位任何查询条件的原样快照，只能按原条件回放（例如翻页）"""
+        headers = {k: v for k, v in (headers or {}).items()
+                   if k.lower() not in DROP_HEADERS and not k.startswith(":")}
+        return cls(url, method, headers, body, {}, {})
+
+    @classmethod
+    def capture(cls, url, method, headers, body, config: dict):
+        values = query_values(config)
+        tpl = cls.raw(url, method, headers, body)
+        tpl.values = values
+        # 日期、集成流取值有辨识度，先定位它们作为锚点，再为状态 (0/1) 这类短值消歧
+        for field in sorted(values, key=lambda f: f == "status"):
+            sites = tpl._find(field, values[field])
+            if field == "status" and len(sites) > 1:
+                sites = tpl._closest_to_anchors(sites)
+            if not sites:
+                print(f"接口模板：未能在请求中唯一定位条件 {field}={values[field]}，该查询组合将继续走浏览器")
+                return None
+            tpl.slots[field] = sites
+
+        # 同一天查询时开始/结束日期值相同：按出现顺序前一半归开始、后一半归结束
+        if values.get("start_date") and values.get("start_date") == values.get("end_date"):
+            sites = tpl.slots["start_date"]
+            if len(sites) < 2:
+                print("接口模板：开始与结束日期相同且无法区分位置，放弃该模板")
+                return None
+            half = len(sites) // 2
+            tpl.slots["start_date"], tpl.slots["end_date"] = sites[:half], sites[half:]
+
+        # 例如未指定日期时前端默认带上当天：这类日期不随条件替换，回放会返回过期数据，不能做成模板
+        unbound = tpl._unbound_dates()
+        if unbound:
+            print(f"接口模板：请求中含有未绑定到查询条件的日期 {'、'.join(sorted(set(unbound)))}，该查询组合将继续走浏览器")
+            return None
+        return tpl
+
+    def _unbound_dates(self) -> list:
+        """返回请求中没有被任何日期条件位置覆盖的日期字面量"""
+        bound = {(site["where"], json.dumps(site["key"], ensure_ascii=False), self.values[field], site["occurrence"])
+                 for field, sites in self.slots.items() if field in DATE_FIELDS for site in sites}
+        unbound = []
+        for where, key, leaf in self._leaves():
+            if not isinstance(leaf, str):
+                continue
+            seen = {}
+            for m in DATE_LITERAL.finditer(leaf):
+                literal = m.group(0)
+                occurrence = seen.get(literal, 0)
+                seen[literal] = occurrence + 1
+                if (where, json.dumps(key, ensure_ascii=False), literal, occurrence) not in bound:
+                    unbound.append(literal)
+        return unbound
+
+    def _leaves(self):
+        """遍历所有可替换的文本位置：URL 查询参数、表单参数、JSON 叶子节点"""
+        for k, v in parse_qsl(urlsplit(self.url).query, keep_blank_values=True):
+            yield "url", k, v
+        body_kind, body_obj = self._parse_body()
+        if body_kind == "json":
+            for path, leaf in _json_leaves(body_obj):
+                yield "json", path, leaf
+        elif body_kind == "form":
+            for k, v in body_obj:
+                yield "form", k, v
+
+    def _parse_body(self):
+        if not self.body:
+            return None, None
+        try:
+            return "json", json.loads(self.body)
+        except ValueError:
+            pass
+        if "=" in self.body:
+            return "form", parse_qsl(self.body, keep_blank_values=True)
+        return None, None
+
+    @staticmethod
+    def _key_name(where, key):
+        if where == "json":
+            named = [k for k in key if isinstance(k, str)]
+            return named[-1] if named else ""
+        return key
+
+    def _find(self, field, value):
+        sites = []
+        for where, key, leaf in self._leaves():
+            if str(self._key_name(where, key)).lower() in PAGING_KEYS:
+                continue
+            if field in DATE_FIELDS:
+                if isinstance(leaf, str):
+                    for i, _ in enumerate(_date_pattern(value).finditer(leaf)):
+                        sites.append({"where": where, "key": key, "occurrence": i})
+            elif str(leaf) == value:
+                sites.append({"where": where, "key": key, "occurrence": None})
+        return sites
+
+    def _closest_to_anchors(self, sites):
+        """在多个候选位置中挑出与已定位条件共享最长路径前缀的那一个；无法唯一确定时返回空"""
+        anchors = [a for field_sites in self.slots.values() for a in field_sites]
+
+        def score(site):
+            best = 0
+            for a in anchors:
+                if a["where"] != site["where"]:
+                    continue
+                if site["where"] != "json":
+                    best = max(best, 1)
+                    continue
+                n = 0
+                for x, y in zip(a["key"], site["key"]):
+                    if x != y:
+                        break
+                    n += 1
+                best = max(best, n)
+            return best
+
+        scored = sorted(((score(s), i) for i, s in enumerate(sites)), reverse=True)
+        if not anchors or scored[0][0] == 0 or (len(scored) > 1 and scored[0][0] == scored[1][0]):
+            return []
+        return [sites[scored[0][1]]]
+
+    def page_index_keys(self):
+        """返回模板中出现的页码参数名及其首页取值 {小写键名: 值}，用于判断页码从 0 还是 1 开始"""
+        found = {}
+        for where, key, leaf in self._leaves():
+            name = str(self._key_name(where, key)).lower()
+            if name in PAGE_INDEX_KEYS and name not in found:
+                try:
+                    found[name] = int(leaf)
+                except (TypeError, ValueError):
+                    continue
+        return found
+
+    def date_has_time(self) -> bool:
+        """模板中的日期条件是否带时间部分（决定能否按小时分片查询）"""
+        date_value = self.values.get("start_date")
+        if not date_value:
+            return False
+        for where, key, leaf in self._leaves():
+            if isinstance(leaf, str):
+                m = _date_pattern(date_value).search(leaf)
+                if m and m.group(1):
+                    return True
+        return False
+
+    # ================= 回放 =================
+    def build(self, config: dict, paging: dict = None):
+        """按新的查询条件（及可选的分页参数）生成 (url, body)"""
+        new_values = query_values(config) if self.slots else {}
+        edits = []  # (site, old, new, is_date)
+        for field, sites in self.slots.items():
+            for site in sites:
+                edits.append((site, self.values[field], new_values[field], field in DATE_FIELDS))
+
+        def apply(where, key, leaf):
+            date_edits = []
+            for site, old, new, is_date in edits:
+                if site["where"] != where or site["key"] != key:
+                    continue
+                if is_date:
+                    date_edits.append((old, new, site["occurrence"]))
+                else:
+                    leaf = type(leaf)(new) if isinstance(leaf, (int, float)) else new
+            if date_edits:
+                leaf = _replace_dates(str(leaf), date_edits)
+            if paging and str(self._key_name(where, key)).lower() in paging:
+                value = paging[str(self._key_name(where, key)).lower()]
+                leaf = type(leaf)(value) if isinstance(leaf, (int, float)) else str(value)
+            return leaf
+
+        parts = urlsplit(self.url)
+        query = [(k, apply("url", k, v)) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+        url = urlunsplit(parts._replace(query=urlencode(query)))
+
+        body_kind, body_obj = self._parse_body()
+        body = self.body
+        if body_kind == "json":
+            body_obj = copy.deepcopy(body_obj)
+            for path, leaf in list(_json_leaves(body_obj)):
+                target = body_obj
+                for p in path[:-1]:
+                    target = target[p]
+                target[path[-1]] = apply("json", path, leaf)
+            body = json.dumps(body_obj, ensure_ascii=False)
+        elif body_kind == "form":
+            body = urlencode([(k, apply("form", k, v)) for k, v in body_obj])
+        return url, body
+
+    # ================= 持久化 =================
+    def to_dict(self):
+        return {"url": self.url, "method": self.method, "headers": self.headers,
+                "body": self.body, "values": self.values, "slots": self.slots}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["url"], d.get("method", "GET"), d.get("headers", {}), d.get("body"),
+                   d.get("values", {}), d.get("slots", {}))
+
+
+class TemplateStore:
+    """
+    按查询形状 (query_shape) 持久化接口模板，保存在 cache/report_templates.json。
+    多个巡检工作线程共用同一文件：读-改-写在进程内加锁，落盘先写临时文件再原子替换。
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, config: dict):
+        self.path = os.path.join(config.get("state_dir", "cache"), "report_templates.json")
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, config: dict):
+        raw = self._load().get(query_shape(config))
+        return ReportTemplate.from_dict(raw) if raw else None
+
+    def put(self, config: dict, template: ReportTemplate):
+        with self._lock:
+            data = self._load()
+            data[query_shape(config)] = template.to_dict()
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"保存接口模板失败: {e}")
+
+
+def _search_cells(obj):
+    """
+    非递归地在 JSON 树中寻找行数最多的 cells 表格，返回 (路径, 表格)。
+    按先序遍历、行数相同时保留先出现的一个，与原先的递归实现结果一致，但不受递归深度限制。
+    """
+    best_path, best_cells = None, []
+    stack = [(obj, ())]
+    while stack:
+        node, path = stack.pop()
+        if isinstance(node, dict):
+            cells = node.get('cells')
+            if isinstance(cells, list) and len(cells) > len(best_cells):
+                best_path, best_cells = path + ('cells',), cells
+            children = node.items()
+        elif isinstance(node, list):
+            children = enumerate(node)
+        else:
+            continue
+        stack.extend(reversed([(v, path + (k,)) for k, v in children if isinstance(v, (dict, list))]))
+    return best_path, best_cells
+
+
+def _follow(obj, path):
+    for key in path:
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        elif isinstance(obj, list) and isinstance(key, int) and key < len(obj):
+            obj = obj[key]
+        else:
+            return None
+    return obj
+
+
+class CellsLocator:
+    """
+    记住 report/refresh 响应中 cells 表格所在的 JSON 路径（落盘到 cache/cells_path.json），
+    之后按路径直接取值；路径失效（接口结构变化）或取到的表格没有数据行时，才退回整树搜索并重新学习。
+    """
+
+    def __init__(self):
+        self.path = None
+        self.path_file = None
+        self._lock = threading.Lock()
+
+    def bind(self, config: dict):
+        """切换到配置中的状态目录并载入已学到的路径"""
+        path_file = os.path.join(config.get("state_dir", "cache"), "cells_path.json")
+        if path_file == self.path_file:
+            return
+        self.path_file = path_file
+        try:
+            with open(path_file, "r", encoding="utf-8") as f:
+                self.path = tuple(json.load(f)["path"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.path = None
+
+    def find(self, obj):
+        path = self.path
+        if path:
+            cells = _follow(obj, path)
+            if isinstance(cells, list) and len(cells) > 1:
+                return cells
+        found_path, cells = _search_cells(obj)
+        if found_path and len(cells) > 1 and found_path != path:
+            self._learn(found_path)
+        return cells
+
+    def _learn(self, path):
+        with self._lock:
+            self.path = path
+            if not self.path_file:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path_file) or ".", exist_ok=True)
+                tmp = f"{self.path_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"path": list(path)}, f, ensure_ascii=False)
+                os.replace(tmp, self.path_file)
+            except OSError as e:
+                print(f"保存 cells 路径失败: {e}")
+
+
+cells_locator = CellsLocator()
+
+
+def find_best_cells(obj):
+    """寻找行数最多的 cells 表格（首行为表头）：优先按已学到的路径直接取，路径失效时再整树搜索"""
+    return cells_locator.find(obj)
+
+
+# ================= 流式解析 =================
+# "cells": [ 数组的起点。JSON 字符串里的引号必须转义，所以字符串内容不会被误认成键
+_CELLS_KEY = re.compile(r'"cells"\s*:\s*\[')
+_SKIP = re.compile(r'[\s,]*')
+_TABLE_MARK = "\x00cells#"
+_decoder = json.JSONDecoder()
+STREAM_CHUNK = 1 << 16
+
+
+def _text_chunks(source, chunk_size: int = STREAM_CHUNK):
+    """把 str / bytes / 字节块迭代器统一为文本块（UTF-8 增量解码，多字节字符可以跨块）"""
+    if isinstance(source, str):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        source = (view[i:i + chunk_size] for i in range(0, len(view), chunk_size))
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in source:
+        if chunk:
+            yield decoder.decode(bytes(chunk))
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class CellsStream:
+    """
+    report/refresh 响应的流式解析器：逐块读取响应体，遇到 "cells" 表格时逐行产出 (表格序号, 行)，
+    内存中只保留当前读取块与当前行，不再同时持有完整响应文本和整棵 JSON 树。
+    表格以外的部分（分页、总条数等，通常很小）拼成骨架，迭代结束后用 skeleton() / payload() 取回。
+    """
+
+    def __init__(self, source, chunk_size: int = STREAM_CHUNK):
+        self._chunks = _text_chunks(source, chunk_size)
+        self._buf = ""
+        self._pos = 0
+        self._parts = []
+        self.tables = 0
+
+    def _more(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _skip(self) -> str:
+        """跳过空白与逗号，返回下一个字符；读到结尾返回空串"""
+        while True:
+            self._pos = _SKIP.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ""
+
+    def _decode(self):
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._more():
+                    continue
+                raise
+            # 值恰好结束在块尾时可能是被截断的数字，再读一块确认
+            if end == len(self._buf) and self._more():
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        while True:
+            m = _CELLS_KEY.search(self._buf, self._pos)
+            if not m:
+                # 留下末尾一小段，防止键名被切在两个块之间
+                keep = max(self._pos, len(self._buf) - 64)
+                self._parts.append(self._buf[self._pos:keep])
+                self._pos = keep
+                if not self._more():
+                    self._parts.append(self._buf[self._pos:])
+                    self._buf, self._pos = "", 0
+                    return
+                continue
+            # 骨架中用占位字符串代替表格内容
+            self._parts.append(self._buf[self._pos:m.end() - 1])
+            self._parts.append(json.dumps(f"{_TABLE_MARK}{self.tables}"))
+            self._pos = m.end()
+            index = self.tables
+            self.tables += 1
+            while True:
+                ch = self._skip()
+                if ch == "]":
+                    self._pos += 1
+                    break
+                if not ch:
+                    raise ValueError("响应在 cells 表格中途截断")
+                yield index, self._decode()
+
+    def skeleton(self):
+        """表格以外部分的 JSON（表格位置为占位字符串），需在迭代结束后调用"""
+        return json.loads("".join(self._parts))
+
+    def payload(self, tables: dict):
+        """把 {表格序号: 行列表} 填回骨架，得到与 json.loads 等价的结构"""
+        root = self.skeleton()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            items = node.items() if isinstance(node, dict) else enumerate(node) if isinstance(node, list) else ()
+            for k, v in list(items):
+                if isinstance(v, str) and v.startswith(_TABLE_MARK):
+                    node[k] = tables.get(int(v[len(_TABLE_MARK):]), [])
+                elif isinstance(v, (dict, list)):
+                    stack.append(v)
+        return root
+
+
+def parse_payload(source):
+    """流式解析一份完整的 report/refresh 响应（结果与 json.loads 相同），source 可以是文本、字节或字节块迭代器"""
+    stream = CellsStream(source)
+    tables = {}
+    for index, row in stream:
+        tables.setdefault(index, []).append(row)
+    return stream.payload(tables)
+
+
+def header_name(col) -> str:
+    """表头单元格可能是 [名称, ...] 列表、{"v": 名称} 字典或纯文本"""
+    if isinstance(col, list) and len(col) > 5:
+        return str(col[0])
+    if isinstance(col, dict) and 'v' in col:
+        return str(col['v'])
+    return str(col)
+
+
+def cell_text(col) -> str:
+    """数据单元格取值规则与表头一致，空值返回空串"""
+    if col is None:
+        return ''
+    return header_name(col)
+
+
+# 表头为空或无意义的列直接丢弃
+JUNK_HEADERS = {'', 'None', 'nan', 'NaN'}
+_ends_with_dot_zero = operator.methodcaller("endswith", ".0")
+
+
+def _column_text(values: list) -> list:
+    """
+    把一整列单元格规范化为去空白的文本。按列内的类型分支批量转换：
+    纯文本 / 纯整数 / 纯浮点列走 map 等内置快路径，只有混合或嵌套结构的列才逐格调用 cell_text。
+    """
+    kinds = set(map(type, values))
+    if kinds <= {str}:
+        out = list(map(str.strip, values))
+    elif kinds <= {int, type(None)}:
+        return ['' if v is None else str(v) for v in values]
+    elif kinds <= {float, int, type(None)}:
+        # 整数值的浮点数（接口把整数序列化成 1.0）去掉 .0 尾巴
+        return ['' if v is None else str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+                for v in values]
+    else:
+        out = [cell_text(v).strip() for v in values]
+    if any(map(_ends_with_dot_zero, out)):
+        out = [v[:-2] if v.endswith('.0') else v for v in out]
+    return out
+
+
+def table_columns(header: list, rows: list) -> dict:
+    """
+    按列抽取 cells 表格：一次转置得到各列，跳过重名与无意义表头的列，再逐列批量规范化为文本。
+    返回 {列名: 文本列表}（保持表头顺序），可直接构造 DataFrame。
+    """
+    names = [header_name(c) for c in header]
+    # 行比表头短时补空，比表头长时多出的单元格忽略
+    columns = list(itertools.islice(itertools.zip_longest(*rows), len(names)))
+    columns.extend([(None,) * len(rows)] * (len(names) - len(columns)))
+    table = {}
+    for name, values in zip(names, columns):
+        if name in table or name in JUNK_HEADERS:
+            continue
+        table[name] = _column_text(values)
+    return table
+
+
+def merge_payloads(payloads: list, dedupe: bool = False) -> dict:
+    """
+    把多个查询的响应合并为一个：以首个含表格的响应为底，其余响应的数据行按表头名对齐后追加。
+    dedupe 为 True 时去掉重复行（有“主键”列按主键判断，否则按整行内容），用于分片边界重叠的情况。
+    """
+    base = next((p for p in payloads if len(find_best_cells(p)) >= 1), payloads[0])
+    for other in payloads:
+        for flow in incomplete_flows(other):
+            mark_incomplete(base, {"integration_flow": flow})
+    cells = find_best_cells(base)
+    if not cells:
+        return base
+    names = [header_name(c) for c in cells[0]]
+    for other in payloads:
+        if other is base:
+            continue
+        other_cells = find_best_cells(other)
+        if len(other_cells) < 2:
+            continue
+        other_names = [header_name(c) for c in other_cells[0]]
+        if other_names == names:
+            cells.extend(other_cells[1:])
+            continue
+        index = {n: i for i, n in enumerate(other_names)}
+        for row in other_cells[1:]:
+            cells.append([row[index[n]] if n in index and index[n] < len(row) else None for n in names])
+
+    if dedupe and len(cells) > 2:
+        key_col = names.index("主键") if "主键" in names else None
+        seen = set()
+        rows = []
+        for row in cells[1:]:
+            key = json.dumps(row[key_col] if key_col is not None and key_col < len(row) else row,
+                             ensure_ascii=False, sort_keys=True)
+            if key not in seen:
+                seen.add(key)
+                rows.append(row)
+        del cells[1:]
+        cells.extend(rows)
+    return base
+
+
+def mark_incomplete(payload: dict, config: dict):
+    """标记该响应中 config 对应集成流的数据不完整"""
+    flows = payload.setdefault(INCOMPLETE_KEY, [])
+    flow = str(config.get("integration_flow", "所有"))
+    if flow not in flows:
+        flows.append(flow)
+
+
+def incomplete_flows(payload: dict) -> set:
+    return set(payload.get(INCOMPLETE_KEY, [])) if isinstance(payload, dict) else set()
+
+
+def find_total_count(obj, keys=TOTAL_COUNT_KEYS):
+    """在响应中查找总记录数，找不到时返回 None"""
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for k in keys:
+                v = node.get(k)
+                if isinstance(v, int) and not isinstance(v, bool):
+                    return v
+                if isinstance(v, str) and v.isdigit():
+                    return int(v)
+            stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+        elif isinstance(node, list):
+            stack.extend(v for v in node if isinstance(v, (dict, list)))
+    return None
+
+
+def load_cookies(state_path: str):
+    """从 Playwright storage_state 文件还原 Cookie，供 requests 直接复用浏览器登录态"""
+    jar = requests.cookies.RequestsCookieJar()
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    for c in state.get("cookies", []):
+        jar.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+    return jar
+
+
+_http = requests.Session()
+
+
+def replay(template: ReportTemplate, config: dict, cookies, paging: dict = None, timeout: int = 60) -> dict:
+    """绕过页面直接请求 report/refresh，返回解析后的 JSON；登录态失效时抛出 SessionExpired"""
+    url, body = template.build(config, paging)
+    with _http.request(template.method or "GET", url, headers=template.headers,
+                       data=body.encode("utf-8") if body else None,
+                       cookies=cookies, timeout=timeout, allow_redirects=False, stream=True) as resp:
+        if resp.status_code in (301, 302, 401, 403):
+            raise SessionExpired(f"接口回放返回 HTTP {resp.status_code}")
+        resp.raise_for_status()
+        if "application/json" not in resp.headers.get("content-type", ""):
+            # 会话过期时网关通常返回登录页 HTML
+            raise SessionExpired("接口回放未返回 JSON，可能已被重定向到登录页")
+        # 边下载边解析，不在内存中保留完整的响应文本
+        data = parse_payload(resp.iter_content(chunk_size=STREAM_CHUNK))
+    if "data" not in data:
+        raise ValueError(f"接口回放返回的数据不含 data 字段: {str(data)[:200]}")
+    return data
+
+
+def page_is_partial(first_rows: int, total, page_size: int) -> bool:
+    """
+    首页之外是否还有数据：响应给出总条数时以总条数为准（不假设服务端遵守了 currPageSize），
+    否则只能以首页是否装满配置的分页规模来判断。
+    """
+    if first_rows == 0:
+        return False
+    if total is not None:
+        return total > first_rows
+    return first_rows >= page_size
+
+
+def fetch_all_pages(first_page: dict, template: ReportTemplate, config: dict, cookies, cache=None) -> dict:
+    """
+    根据首页响应中的总条数补齐剩余分页（有界并发），并把各页 cells 的数据行合并进首页的表格。
+    传入 ResponseCache 时，各页响应先查缓存、取回后写入缓存。返回合并后的首页响应（原地修改）。
+    """
+    if cache:
+        cache.put(config, first_page, 1)
+    page_size = int(config.get("page_size", 1000))
+    concurrency = max(1, int(config.get("page_concurrency", 4)))
+    cells = find_best_cells(first_page)
+    first_rows = max(len(cells) - 1, 0)
+    total = find_total_count(first_page, tuple(config.get("total_count_keys", TOTAL_COUNT_KEYS)))
+    if not page_is_partial(first_rows, total, page_size):
+        return first_page
+    # 服务端可能忽略或压低 currPageSize（例如前端只选到了 500），以首页实际返回的行数作为每页条数
+    per_page = first_rows
+
+    index_keys = template.page_index_keys()
+    if not index_keys:
+        print(f"[PROGRESS] ⚠️ 首页只返回了 {first_rows} 条（共 {total if total is not None else '未知'} 条），"
+              f"但请求中未找到页码参数，超出部分无法补抓！", flush=True)
+        mark_incomplete(first_page, config)
+        return first_page
+    base = min(index_keys.values())
+
+    def fetch(page_no):
+        paging = {k: base + page_no - 1 for k in index_keys}
+        cached = cache.get(config, page_no) if cache else None
+        if cached is not None:
+            return page_no, find_best_cells(cached)[1:]
+        for attempt in range(2):
+            try:
+                data = replay(template, config, cookies, paging=paging)
+                if cache:
+                    cache.put(config, data, page_no)
+                return page_no, find_best_cells(data)[1:]
+            except SessionExpired:
+                raise
+            except Exception as e:
+                if attempt:
+                    print(f"获取第 {page_no} 页失败: {e}")
+        return page_no, None
+
+    pages = {1: cells[1:]}
+    failed = []
+    fetch = carry_context(fetch)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if total is not None:
+            page_count = math.ceil(total / per_page)
+            print(f"[PROGRESS] 共 {total} 条记录，分 {page_count} 页并发获取（并发 {concurrency}）...", flush=True)
+            for page_no, rows in pool.map(fetch, range(2, page_count + 1)):
+                if rows is None:
+                    failed.append(page_no)
+                else:
+                    pages[page_no] = rows
+        else:
+            # 响应中没有总条数：按并发批次向后探测，直到遇到不满一页的结果
+            print("[PROGRESS] 响应未提供总条数，按批次向后探测剩余分页...", flush=True)
+            next_page = 2
+            while True:
+                batch = range(next_page, next_page + concurrency)
+                done = False
+                for page_no, rows in pool.map(fetch, batch):
+                    if rows is None:
+                        failed.append(page_no)
+                        done = True
+                        continue
+                    pages[page_no] = rows
+                    if len(rows) < per_page:
+                        done = True
+                if done:
+                    break
+                next_page += concurrency
+
+    if failed:
+        print(f"[PROGRESS] ⚠️ 第 {failed} 页获取失败，本次报告数据可能不完整！", flush=True)
+        mark_incomplete(first_page, config)
+
+    del cells[1:]
+    for page_no in sorted(pages):
+        cells.extend(pages[page_no])
+    print(f"[PROGRESS] 分页合并完成：共获取 {len(cells) - 1} 条记录", flush=True)
+    return first_page
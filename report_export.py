@@ -0,0 +1,116 @@
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# Excel 单元格最多容纳的字符数，超长报文截断，避免写出损坏的文件
+EXCEL_CELL_LIMIT = 32767
+DEFAULT_FORMATS = ["txt", "xlsx"]
+# 格式名 -> 文件扩展名
+EXTENSIONS = {"txt": ".txt", "xlsx": ".xlsx", "csv.gz": ".csv.gz", "parquet": ".parquet"}
+
+
+def export_paths(base: str = "error_logs", formats=None) -> list:
+    return [base + EXTENSIONS[f] for f in (formats or DEFAULT_FORMATS) if f in EXTENSIONS]
+
+
+def _cell(value):
+    """把单元格转换为 Excel 可写入的值：空值写空白，超长文本截断"""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, str) and len(value) > EXCEL_CELL_LIMIT:
+        return value[:EXCEL_CELL_LIMIT]
+    return value
+
+
+def _write_xlsx(df: pd.DataFrame, path: str):
+    """
+    逐行流式写出 xlsx：优先用 xlsxwriter 的 constant_memory 模式（每写完一行即落盘），
+    未安装时退回 openpyxl 的 write_only 模式，内存占用都与行数无关。
+    """
+    datetime_cols = {i for i, c in enumerate(df.columns) if pd.api.types.is_datetime64_any_dtype(df[c])}
+    rows = df.itertuples(index=False, name=None)
+    if xlsxwriter is not None:
+        # 报文原样写为文本：不把 http(s):// 开头的内容转成超链接（超过 2079 字符或单表超过 65530 个链接时会被丢弃），
+        # 也不把 = 开头的内容当作公式，与原先 to_excel 的输出一致
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False,
+                                              "strings_to_formulas": False})
+        try:
+            sheet = workbook.add_worksheet("Sheet1")
+            bold = workbook.add_format({"bold": True})
+            time_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+            sheet.write_row(0, 0, [str(c) for c in df.columns], bold)
+            for r, row in enumerate(rows, start=1):
+                for c, value in enumerate(row):
+                    value = _cell(value)
+                    if value is None:
+                        continue
+                    if c in datetime_cols:
+                        sheet.write_datetime(r, c, value.to_pydatetime(), time_format)
+                    else:
+                        sheet.write(r, c, value)
+        finally:
+            workbook.close()
+        return
+
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append([str(c) for c in df.columns])
+    for row in rows:
+        values = []
+        for value in row:
+            value = _cell(value)
+            if isinstance(value, str):
+                value = ILLEGAL_CHARACTERS_RE.sub("", value)
+            elif isinstance(value, pd.Timestamp):
+                value = value.to_pydatetime()
+            values.append(value)
+        sheet.append(values)
+    workbook.save(path)
+
+
+def _write_txt(df: pd.DataFrame, path: str):
+    # 写入 txt 时使用 utf-8-sig，防止在 Windows 系统中乱码
+    df.to_csv(path, sep='\t', index=False, encoding='utf-8-sig')
+
+
+def _write_csv_gz(df: pd.DataFrame, path: str):
+    with gzip.open(path, "wt", encoding="utf-8-sig", newline="") as f:
+        df.to_csv(f, index=False)
+
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    # 需要 pyarrow；category 列原样保留，读回时无需重新推断类型
+    df.to_parquet(path, index=False)
+
+
+WRITERS = {"txt": _write_txt, "xlsx": _write_xlsx, "csv.gz": _write_csv_gz, "parquet": _write_parquet}
+
+
+def export_report(df: pd.DataFrame, base: str = "error_logs", formats=None) -> list:
+    """
+    按 formats（txt / xlsx / csv.gz / parquet，默认 txt + xlsx）并发写出报表，返回成功生成的文件列表。
+    单个格式写出失败只打印错误，不影响其余格式。
+    """
+    formats = [f for f in (formats or DEFAULT_FORMATS) if f in WRITERS]
+    paths = export_paths(base, formats)
+
+    def write(item):
+        fmt, path = item
+        try:
+            WRITERS[fmt](df, path)
+            return path
+        except Exception as e:
+            print(f"导出 {path} 失败: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, len(formats))) as pool:
+        return [p for p in pool.map(write, zip(formats, paths)) if p]
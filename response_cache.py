@@ -0,0 +1,126 @@
+import os
+import gzip
+import json
+import math
+import time
+import hashlib
+import threading
+from datetime import datetime
+from report_api import find_best_cells, find_total_count, page_is_partial, TOTAL_COUNT_KEYS
+
+
+class ResponseCache:
+    """
+    report/refresh 响应的磁盘缓存（gzip 压缩 JSON），按规范化后的查询条件 + 页码作为键。
+    - 查询区间包含今天的结果在 ttl 秒内有效；结束日期早于今天的历史区间不会再变化，永久缓存；
+    - 总大小超过 max_mb 时按最近使用时间淘汰。
+    对应配置项 response_cache：{"enabled": true, "ttl": 300, "max_mb": 200}
+    """
+
+    def __init__(self, config: dict):
+        conf = config.get("response_cache", {})
+        self.enabled = conf.get("enabled", True)
+        self.ttl = conf.get("ttl", 300)
+        self.max_bytes = conf.get("max_mb", 200) * 1024 * 1024
+        self.page_size = int(config.get("page_size", 1000))
+        self.total_keys = tuple(config.get("total_count_keys", TOTAL_COUNT_KEYS))
+        self.dir = os.path.join(config.get("state_dir", "cache"), "responses")
+
+    @staticmethod
+    def _normalize(config: dict, page: int) -> str:
+        query = {
+            "start_date": str(config.get("start_date") or ""),
+            "end_date": str(config.get("end_date") or ""),
+            "status": str(config.get("status", "2")),
+            "integration_flow": config.get("integration_flow", "所有"),
+            "page_size": str(config.get("page_size", 1000)),
+            "page": page,
+        }
+        return json.dumps(query, ensure_ascii=False, sort_keys=True)
+
+    def _paths(self, config: dict, page: int):
+        key = hashlib.sha1(self._normalize(config, page).encode("utf-8")).hexdigest()
+        # 历史区间与当天区间分开命名，前者不受 TTL 限制
+        return os.path.join(self.dir, f"{key}.json.gz"), os.path.join(self.dir, f"{key}.perm.json.gz")
+
+    @staticmethod
+    def _is_historical(config: dict) -> bool:
+        end = config.get("end_date")
+        return bool(end) and str(end)[:10] < datetime.now().strftime("%Y-%m-%d")
+
+    def get(self, config: dict, page: int = 1):
+        if not self.enabled:
+            return None
+        path, perm_path = self._paths(config, page)
+        for p, permanent in ((perm_path, True), (path, False)):
+            try:
+                with gzip.open(p, "rt", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if not permanent and time.time() - entry.get("cached_at", 0) > self.ttl:
+                    continue
+                # 命中即刷新文件修改时间，作为 LRU 淘汰依据（TTL 以写入时间计）
+                os.utime(p)
+                return entry["data"]
+            except (OSError, ValueError, KeyError):
+                continue
+        return None
+
+    def put(self, config: dict, payload: dict, page: int = 1):
+        if not self.enabled:
+            return
+        path, perm_path = self._paths(config, page)
+        target = perm_path if self._is_historical(config) else path
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump({"cached_at": time.time(), "data": payload}, f, ensure_ascii=False)
+            os.replace(tmp, target)
+        except OSError as e:
+            print(f"写入响应缓存失败: {e}")
+            return
+        self._evict()
+
+    def get_query(self, config: dict):
+        """整次查询的所有分页都在缓存中时返回合并后的首页响应，否则返回 None"""
+        first = self.get(config, 1)
+        if first is None:
+            return None
+        cells = find_best_cells(first)
+        first_rows = max(len(cells) - 1, 0)
+        total = find_total_count(first, self.total_keys)
+        if not page_is_partial(first_rows, total, self.page_size):
+            return first
+        # 与 fetch_all_pages 一致：每页条数以首页实际返回的行数为准
+        page_count = math.ceil(total / first_rows) if total is not None else None
+        page_no = 2
+        while page_count is None or page_no <= page_count:
+            data = self.get(config, page_no)
+            if data is None:
+                return None
+            rows = find_best_cells(data)[1:]
+            cells.extend(rows)
+            if page_count is None and len(rows) < first_rows:
+                break
+            page_no += 1
+        return first
+
+    def _evict(self):
+        try:
+            entries = []
+            for name in os.listdir(self.dir):
+                if name.endswith(".json.gz"):
+                    p = os.path.join(self.dir, name)
+                    st = os.stat(p)
+                    entries.append((st.st_mtime, st.st_size, p))
+        except OSError:
+            return
+        total = sum(e[1] for e in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                continue
@@ -0,0 +1,37 @@
+import main
+import report_api
+from incremental import IncrementalStore
+
+HEADER = ["集成流", "消息", "创建时间"]
+
+
+def _payload(flow, time):
+    return {"data": {"cells": [HEADER, [flow, "失败", time]]}}
+
+
+def test_incomplete_flow_keeps_previous_mark(tmp_path):
+    config = {"state_dir": str(tmp_path), "incremental": True, "integration_flow": ["A", "B"],
+              "start_date": "2026-02-26", "end_date": "2026-02-26"}
+    a = _payload("A", "2026-02-26 10:00:00")
+    b = _payload("B", "2026-02-26 11:00:00")
+    # B 的某个分片或分页没取到
+    report_api.mark_incomplete(b, {"integration_flow": "B"})
+    merged = report_api.merge_payloads([a, b], dedupe=True)
+    main._finish_incremental(config, merged, [])
+
+    store = IncrementalStore(config)
+    assert store.load(dict(config, integration_flow="A"))["mark"] == "2026-02-26 10:00:00"
+    assert store.load(dict(config, integration_flow="B")) is None
+
+
+def test_failed_page_marks_payload_incomplete(monkeypatch):
+    def page(n, rows):
+        return {"data": {"totalCount": 5, "cells": [HEADER] + [["A", f"p{n}-{i}", "2026-02-26"] for i in range(rows)]}}
+
+    def fake_replay(template, config, cookies, paging=None):
+        raise RuntimeError("timeout")
+
+    monkeypatch.setattr(report_api, "replay", fake_replay)
+    template = report_api.ReportTemplate("https://oms.example.com/report/refresh?currPage=1", "GET", {}, None, {}, {})
+    result = report_api.fetch_all_pages(page(1, 2), template, {"integration_flow": "A"}, None)
+    assert report_api.incomplete_flows(result) == {"A"}
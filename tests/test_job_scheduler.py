@@ -0,0 +1,57 @@
+import threading
+import time
+
+import job_scheduler
+import main
+
+
+class _IdlePool:
+    def __init__(self, config, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+def test_late_subscriber_gets_ordered_progress_before_done(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def fake_run(params, pool=None, output_dir=None):
+        print("[PROGRESS] step1", flush=True)
+        started.set()
+        release.wait(5)
+        for i in range(2, 6):
+            print(f"[PROGRESS] step{i}", flush=True)
+        return main.InspectionResult(summary="ok")
+
+    monkeypatch.setattr(job_scheduler, "BrowserPool", _IdlePool)
+    monkeypatch.setattr(main, "run_inspection", fake_run)
+    monkeypatch.setattr(main, "load_config", lambda: {})
+    scheduler = job_scheduler.JobScheduler({"scheduler": {"jobs_dir": "unused"}})
+    monkeypatch.setattr(scheduler, "cleanup", lambda: None)
+
+    job, _ = scheduler.submit({"start_date": "2026-02-26"}, "a")
+    assert started.wait(5)
+
+    events = []
+
+    def slow_start(j):
+        # 开始通知还没处理完时，任务继续输出并结束
+        release.set()
+        job.finished.wait(5)
+        events.append("START")
+
+    shared, _ = scheduler.submit({"start_date": "2026-02-26"}, "b", on_line=events.append,
+                                 on_start=slow_start, on_done=lambda j: events.append("DONE"))
+    assert shared is job
+    deadline = time.time() + 5
+    while "DONE" not in events and time.time() < deadline:
+        time.sleep(0.01)
+    assert events == ["START"] + [f"[PROGRESS] step{i}" for i in range(1, 6)] + ["DONE"]
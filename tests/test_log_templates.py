@@ -0,0 +1,49 @@
+import main
+from log_templates import TemplateMiner
+
+ERP_ERRORS = [
+    "调用ERP接口返回错误：单据已审核",
+    "调用ERP接口返回错误：库存不足",
+    "调用ERP接口返回错误：价格错误",
+]
+
+
+def test_distinct_text_messages_stay_separate(tmp_path):
+    miner = TemplateMiner(str(tmp_path / "log_templates.json"))
+    ids = miner.assign(ERP_ERRORS)
+    assert len(set(ids)) == 3
+
+
+def test_only_masked_variables_merge(tmp_path):
+    miner = TemplateMiner(str(tmp_path / "log_templates.json"))
+    ids = miner.assign(["订单 1234 推送失败", "订单 5678 推送失败", "订单 1234 推送超时"])
+    assert ids[0] == ids[1] != ids[2]
+
+
+def test_short_and_long_order_numbers_and_units_merge(tmp_path):
+    miner = TemplateMiner(str(tmp_path / "log_templates.json"))
+    timeouts = miner.assign(["连接超时 9ms", "连接超时 16ms", "连接超时 1500ms"])
+    orders = miner.assign(["单据 PO1 推送失败", "单据 PO12345 推送失败", "单据 CG-2026-0001 推送失败"])
+    assert len(set(timeouts)) == 1
+    assert len(set(orders)) == 1
+    assert timeouts[0] != orders[0]
+
+
+def test_persisted_templates_keep_messages_separate(tmp_path):
+    path = str(tmp_path / "log_templates.json")
+    miner = TemplateMiner(path)
+    first = miner.assign(ERP_ERRORS)
+    miner.save()
+    assert TemplateMiner(path).assign(ERP_ERRORS) == first
+
+
+def test_default_rules_keep_distinct_errors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    header = ["集成流", "消息", "创建时间", "状态", "请求报文"]
+    rows = [["A", msg, f"2026-02-26 10:00:0{i}", "1", f"body-{i}"] for i, msg in enumerate(ERP_ERRORS)]
+    config = {"state_dir": str(tmp_path / "cache"), "history": False, "export_formats": ["txt"],
+              "start_date": "2026-02-26", "end_date": "2026-02-26"}
+    result = main.process_and_save_data(main.InspectionResult(header=header, rows=rows), config)
+    assert result.df is not None
+    assert len(result.df) == 3
+    assert result.df["模板ID"].nunique() == 3
@@ -0,0 +1,14 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from report_export import export_report
+
+
+def test_xlsx_keeps_long_urls_and_formula_like_text(tmp_path):
+    long_url = "https://oms.example.com/callback?payload=" + "x" * 3000
+    df = pd.DataFrame({"请求报文": [long_url, "=SUM(A1:A2)", "http://short.example.com"]})
+    (path,) = export_report(df, str(tmp_path / "error_logs"), ["xlsx"])
+    sheet = load_workbook(path).active
+    cells = [sheet.cell(row=r, column=1) for r in range(2, 5)]
+    assert [c.value for c in cells] == list(df["请求报文"])
+    assert all(c.data_type == "s" and c.hyperlink is None for c in cells)
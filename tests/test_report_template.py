@@ -0,0 +1,68 @@
+import json
+from urllib.parse import parse_qsl, urlsplit
+
+from report_api import ReportTemplate
+
+URL = "https://oms.example.com/report/refresh?currPage=1&currPageSize=1000"
+
+
+def _capture(body: dict, config: dict) -> ReportTemplate:
+    tpl = ReportTemplate.capture(URL, "POST", {}, json.dumps(body, ensure_ascii=False), config)
+    assert tpl is not None
+    return tpl
+
+
+def _built_body(tpl: ReportTemplate, config: dict, paging: dict = None) -> dict:
+    url, body = tpl.build(config, paging)
+    return json.loads(body)
+
+
+def test_separate_date_fields_round_trip():
+    tpl = _capture({"condition": {"startTime": "2026-02-10 00:00:00", "endTime": "2026-02-12 23:59:59"}},
+                   {"start_date": "2026-02-10", "end_date": "2026-02-12"})
+    body = _built_body(tpl, {"start_date": "2026-02-12", "end_date": "2026-02-15"})
+    assert body == {"condition": {"startTime": "2026-02-12 00:00:00", "endTime": "2026-02-15 23:59:59"}}
+
+
+def test_same_day_split_round_trip():
+    tpl = _capture({"startTime": "2026-02-17 00:00:00", "endTime": "2026-02-17 23:59:59"},
+                   {"start_date": "2026-02-17", "end_date": "2026-02-17"})
+    body = _built_body(tpl, {"start_date": "2026-02-18", "end_date": "2026-02-20"})
+    assert body == {"startTime": "2026-02-18 00:00:00", "endTime": "2026-02-20 23:59:59"}
+
+
+def test_both_dates_in_one_leaf_same_day():
+    tpl = _capture({"createTime": "2026-02-17 00:00:00,2026-02-17 23:59:59"},
+                   {"start_date": "2026-02-17", "end_date": "2026-02-17"})
+    body = _built_body(tpl, {"start_date": "2026-02-18", "end_date": "2026-02-20"})
+    assert body == {"createTime": "2026-02-18 00:00:00,2026-02-20 23:59:59"}
+
+
+def test_both_dates_in_one_leaf_overlapping_new_range():
+    tpl = _capture({"createTime": "2026-02-10 00:00:00,2026-02-12 23:59:59"},
+                   {"start_date": "2026-02-10", "end_date": "2026-02-12"})
+    body = _built_body(tpl, {"start_date": "2026-02-12", "end_date": "2026-02-15"})
+    assert body == {"createTime": "2026-02-12 00:00:00,2026-02-15 23:59:59"}
+
+
+def test_date_with_time_replaces_whole_value():
+    tpl = _capture({"createTime": "2026-02-17 00:00:00,2026-02-17 23:59:59"},
+                   {"start_date": "2026-02-17", "end_date": "2026-02-17"})
+    body = _built_body(tpl, {"start_date": "2026-02-18 06:00:00", "end_date": "2026-02-18 06:59:59"})
+    assert body == {"createTime": "2026-02-18 06:00:00,2026-02-18 06:59:59"}
+
+
+def test_status_flow_and_paging_round_trip():
+    tpl = _capture({"startTime": "2026-02-10", "endTime": "2026-02-12", "status": "1", "flow": "订单同步"},
+                   {"start_date": "2026-02-10", "end_date": "2026-02-12", "status": "1",
+                    "integration_flow": "订单同步"})
+    url, body = tpl.build({"start_date": "2026-02-11", "end_date": "2026-02-11", "status": "0",
+                           "integration_flow": "库存同步"}, paging={"currpage": 3})
+    assert json.loads(body) == {"startTime": "2026-02-11", "endTime": "2026-02-11", "status": "0", "flow": "库存同步"}
+    assert dict(parse_qsl(urlsplit(url).query))["currPage"] == "3"
+
+
+def test_unbound_date_literal_is_not_templated():
+    body = json.dumps({"createTime": "2026-02-17 00:00:00,2026-02-17 23:59:59", "flow": "订单同步"},
+                      ensure_ascii=False)
+    assert ReportTemplate.capture(URL, "POST", {}, body, {"integration_flow": "订单同步"}) is None
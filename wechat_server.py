@@ -6,9 +6,9 @@ import os
 import xml.etree.ElementTree as ET
 from wechat_msg_crypt import WXBizMsgCrypt
 from wechat_utils import WeChatUtils
-import subprocess
+from job_scheduler import JobScheduler, QueueFull
+from progress import ProgressChannel
 import time
-import sys
 from datetime import datetime
 import re
 
@@ -53,6 +53,8 @@ crypt = WXBizMsgCrypt(
     corpid=w_config.get("corpid")
 )
 utils = WeChatUtils(config)
+# 常驻工作线程在进程内执行巡检，浏览器与登录态在任务之间复用
+scheduler = JobScheduler(config)
 
 @app.get("/wechat", response_class=PlainTextResponse)
 async def verify_url(
@@ -71,80 +73,75 @@ async def verify_url(
     return "error"
 
 def run_inspection_and_reply(user_id: str, user_data: dict = None):
-    """后台执行巡检并发送实时进度及文件"""
-    print(f"开始为用户 {user_id} 执行巡检任务...")
-    utils.send_text(user_id, "收到指令，正在启动日志巡检，请稍候...")
-    
+    """把巡检任务交给常驻调度器排队执行，发送实时进度及文件"""
     # 初始化日志目录
     os.makedirs("logs", exist_ok=True)
-    task_time = time.strftime("%Y%m%d_%H%M%S")
-    log_file_path = os.path.join("logs", f"task_{task_time}.txt")
-    
-    try:
-        env = os.environ.copy()
-        if user_data:
-            env["DYNAMIC_PARAMS"] = json.dumps(user_data)
+    log_files = {}
+    # 进度经后台通道攒批后合并为一条消息推送，不阻塞巡检线程
+    progress = {}
+
+    def on_line(clean_line):
+        # 写入本地备份日志，增加时间戳前缀
+        lf = log_files.get("lf")
+        if lf:
+            current_time_str = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
+            lf.write(f"{current_time_str} {clean_line}\n")
+            lf.flush()
+
+        # 只有匹配 [PROGRESS] 标签的行才发给用户
+        if "[PROGRESS]" in clean_line and progress.get("channel"):
+            msg = clean_line.replace("[PROGRESS]", "").strip()
+            progress["channel"].push(f"📌 {msg}")
+
+    def on_start(job):
+        print(f"开始为用户 {user_id} 执行巡检任务 {job.id}...")
+        log_files["lf"] = open(os.path.join("logs", f"task_{job.id}_{user_id}.txt"), "w", encoding="utf-8")
+        utils.send_text(user_id, "收到指令，正在启动日志巡检，请稍候...")
+        progress["channel"] = ProgressChannel(lambda batch: utils.send_text(user_id, "\n".join(batch)), config)
+
+    def on_done(job):
+        # 先把剩余进度推完，保证战报排在进度之后
+        channel = progress.pop("channel", None)
+        if channel:
+            channel.close()
+        lf = log_files.pop("lf", None)
+        if lf:
+            lf.close()
+        if job.error is not None:
+            utils.send_text(user_id, f"❌ 执行任务时发生错误: {job.error}")
+            return
+        result = job.result
+        excel_path = next((f for f in result.files if f.endswith(".xlsx")), None)
 
-        # 使用 Popen 以便实时获取 stdout
-        process = subprocess.Popen(
-            [sys.executable, "main.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            encoding='utf-8',
-            env=env,
-            bufsize=1
-        )
-        
-        with open(log_file_path, "w", encoding="utf-8") as lf:
-            for line in iter(process.stdout.readline, ''):
-                clean_line = line.strip()
-                if not clean_line:
-                    continue
-                
-                # 写入本地备份日志，增加时间戳前缀
-                current_time_str = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-                lf.write(f"{current_time_str} {clean_line}\n")
-                lf.flush()
-                
-                # 只有匹配 [PROGRESS] 标签的行才发给用户
-                if "[PROGRESS]" in clean_line:
-                    msg = clean_line.replace("[PROGRESS]", "").strip()
-                    utils.send_text(user_id, f"📌 {msg}")
-                
-                # 同时在服务端控制台打印所有输出
-                print(clean_line)
-            
-        process.stdout.close()
-        process.wait()
-        
-        excel_path = "error_logs.xlsx"
-        excel_path = "error_logs.xlsx"
-        
         # 1. 企微发送原生 Markdown 战报卡片
-        summary_path = "report_summary.md"
-        if os.path.exists(summary_path):
+        if result.summary:
             try:
-                with open(summary_path, "r", encoding="utf-8") as f:
-                    md_content = f.read()
                 # 企微软原生不支持带颜色的 config，但原生支持 markdown 格式解析
-                utils.send_markdown(user_id, md_content)
+                utils.send_markdown(user_id, result.summary)
             except Exception as e:
-                print(f"读取或发送摘要战报失败: {e}")
+                print(f"发送摘要战报失败: {e}")
         else:
             utils.send_text(user_id, "巡检已执行完毕。")
 
         # 2. 如果有文件，作为附件紧跟着发送
-        if os.path.exists(excel_path):
+        if excel_path and os.path.exists(excel_path):
             media_id_xls = utils.upload_file(excel_path)
             if media_id_xls:
                 utils.send_file(user_id, media_id_xls)
             else:
                 utils.send_text(user_id, "⚠️ 巡检已完成，但长篇 Excel 报告上传企微临时素材库失败。")
-            
-    except Exception as e:
-        print(f"执行巡检出错: {e}")
-        utils.send_text(user_id, f"❌ 执行任务时发生错误: {str(e)}")
+
+    try:
+        job, ahead = scheduler.submit(user_data, requester=user_id,
+                                      on_line=on_line, on_start=on_start, on_done=on_done)
+    except QueueFull as e:
+        utils.send_text(user_id, f"⚠️ {e}")
+        return
+    if job.requester != user_id:
+        # 相同查询条件的任务已在排队或执行，合并后与发起人共享进度与结果
+        utils.send_text(user_id, "🔗 已有相同条件的巡检任务在进行，已为您合并，进度与结果将同步推送。")
+    elif ahead:
+        utils.send_text(user_id, f"⏳ 巡检任务已排队，前面还有 {ahead} 个任务，轮到您时将自动开始。")
 
 @app.post("/wechat")
 async def handle_message(
@@ -183,7 +180,7 @@ async def handle_message(
                 # 用户主动取消
                 if content.lower() in ['取消', '取消巡检', 'cancel', '退出']:
                     del wechat_sessions[user_id]
-                    utils.send_text(user_id, "已为您取消本次巡检引导。")
+                    await utils.asend_text(user_id, "已为您取消本次巡检引导。")
                     return "success"
                     
                 if step == "START_DATE":
@@ -191,42 +188,42 @@ async def handle_message(
                         session["data"]["start_date"] = None
                         session["step"] = "END_DATE"
                         session["retries"] = 0
-                        utils.send_text(user_id, "✅ 已跳过开始日期。请回复「结束日期」(如: 2026-02-15)。若不需要，请回复「无」或「跳过」:")
+                        await utils.asend_text(user_id, "✅ 已跳过开始日期。请回复「结束日期」(如: 2026-02-15)。若不需要，请回复「无」或「跳过」:")
                     else:
                         parsed = parse_date(content)
                         if parsed:
                             session["data"]["start_date"] = parsed
                             session["step"] = "END_DATE"
                             session["retries"] = 0
-                            utils.send_text(user_id, f"✅ 已记录开始日期为 {parsed}。请回复「结束日期」(如: 2026-02-15)。若不需要，请回复「无」或「跳过」:")
+                            await utils.asend_text(user_id, f"✅ 已记录开始日期为 {parsed}。请回复「结束日期」(如: 2026-02-15)。若不需要，请回复「无」或「跳过」:")
                         else:
                             session["retries"] += 1
                             if session["retries"] >= 3:
                                 del wechat_sessions[user_id]
-                                utils.send_text(user_id, "❌ 多次输入错误，为防止卡死，已自动退出巡检引导。请重新输入“巡检”唤起。")
+                                await utils.asend_text(user_id, "❌ 多次输入错误，为防止卡死，已自动退出巡检引导。请重新输入“巡检”唤起。")
                             else:
-                                utils.send_text(user_id, "⚠️ 日期格式无法被系统识别，请按照「YYYY-MM-DD」或者「20260212」格式重新输入！(若想退出请回复 取消)")
+                                await utils.asend_text(user_id, "⚠️ 日期格式无法被系统识别，请按照「YYYY-MM-DD」或者「20260212」格式重新输入！(若想退出请回复 取消)")
                 
                 elif step == "END_DATE":
                     if content.lower() in ["无", "跳过", "今天"]:
                         session["data"]["end_date"] = None
                         session["step"] = "STATUS"
                         session["retries"] = 0
-                        utils.send_text(user_id, "✅ 已跳过结束日期。\n请回复想要查询的「状态」：\n- 回复 `1` (或 `报错`): 只查询报错记录 (推荐)\n- 回复 `0` (或 `成功`): 只查询成功记录\n- 回复 `2` (或 `全部`): 拉取所有请求并在本地过滤")
+                        await utils.asend_text(user_id, "✅ 已跳过结束日期。\n请回复想要查询的「状态」：\n- 回复 `1` (或 `报错`): 只查询报错记录 (推荐)\n- 回复 `0` (或 `成功`): 只查询成功记录\n- 回复 `2` (或 `全部`): 拉取所有请求并在本地过滤")
                     else:
                         parsed = parse_date(content)
                         if parsed:
                             session["data"]["end_date"] = parsed
                             session["step"] = "STATUS"
                             session["retries"] = 0
-                            utils.send_text(user_id, f"✅ 已记录结束日期为 {parsed}。\n请回复想要查询的「状态」：\n- 回复 `1` (或 `报错`): 只查询报错记录 (推荐)\n- 回复 `0` (或 `成功`): 只查询成功记录\n- 回复 `2` (或 `全部`): 拉取所有请求并在本地过滤")
+                            await utils.asend_text(user_id, f"✅ 已记录结束日期为 {parsed}。\n请回复想要查询的「状态」：\n- 回复 `1` (或 `报错`): 只查询报错记录 (推荐)\n- 回复 `0` (或 `成功`): 只查询成功记录\n- 回复 `2` (或 `全部`): 拉取所有请求并在本地过滤")
                         else:
                             session["retries"] += 1
                             if session["retries"] >= 3:
                                 del wechat_sessions[user_id]
-                                utils.send_text(user_id, "❌ 多次输入错误，由于安全策略，已自动退出向导。")
+                                await utils.asend_text(user_id, "❌ 多次输入错误，由于安全策略，已自动退出向导。")
                             else:
-                                utils.send_text(user_id, "⚠️ 日期格式无法被系统识别，请正确如 2026-02-28 格式重新输入:")
+                                await utils.asend_text(user_id, "⚠️ 日期格式无法被系统识别，请正确如 2026-02-28 格式重新输入:")
                 
                 elif step == "STATUS":
                     status_map = {"1": "1", "报错": "1", "0": "0", "成功": "0", "2": "2", "全部": "2"}
@@ -237,21 +234,24 @@ async def handle_message(
                         
                         flows = config.get("integration_flows", ["所有"])
                         flow_str = "\n".join([f"- {i+1}. {name}" for i, name in enumerate(flows)])
-                        utils.send_text(user_id, f"✅ 已确认状态过滤级别。\n最后一步，请告诉我您监控的「集成流」要求：\n您可以直接输入集成流名称关键词或下方序号，如果不需要过滤请回复「所有」或数字「1」:\n{flow_str}")
+                        await utils.asend_text(user_id, f"✅ 已确认状态过滤级别。\n最后一步，请告诉我您监控的「集成流」要求：\n您可以直接输入集成流名称关键词或下方序号，多个序号可用逗号分隔，如果不需要过滤请回复「所有」或数字「1」:\n{flow_str}")
                     else:
                         session["retries"] += 1
                         if session["retries"] >= 3:
                             del wechat_sessions[user_id]
-                            utils.send_text(user_id, "❌ 多次输入错误，向导已退出。")
+                            await utils.asend_text(user_id, "❌ 多次输入错误，向导已退出。")
                         else:
-                            utils.send_text(user_id, "⚠️ 无法识别。请明确回复数字 `1` (报错) 或 `2` (全部):")
+                            await utils.asend_text(user_id, "⚠️ 无法识别。请明确回复数字 `1` (报错) 或 `2` (全部):")
                 
                 elif step == "FLOW":
                     flows = config.get("integration_flows", ["所有"])
                     selected_flow = "所有"
                     
-                    if content.isdigit() and 1 <= int(content) <= len(flows):
-                        selected_flow = flows[int(content) - 1]
+                    # 支持 "3,5,7" 形式一次选择多个集成流
+                    numbers = [x for x in re.split(r"[,，、\s]+", content) if x]
+                    if numbers and all(x.isdigit() and 1 <= int(x) <= len(flows) for x in numbers):
+                        selected = [flows[int(x) - 1] for x in numbers]
+                        selected_flow = selected[0] if len(selected) == 1 else selected
                     else:
                         selected_flow = content
                     
@@ -259,15 +259,15 @@ async def handle_message(
                     user_params = session["data"]
                     del wechat_sessions[user_id]
                     
-                    utils.send_text(user_id, f"✅ 设定完毕！参数打包成功！引擎正在以此规则为您拉起无头浏览器...")
+                    await utils.asend_text(user_id, f"✅ 设定完毕！参数打包成功！引擎正在以此规则为您拉起无头浏览器...")
                     background_tasks.add_task(run_inspection_and_reply, user_id, user_params)
             else:
                 if content in ["开始巡检", "巡检", "run"]:
                     # 开启新的会话状态
                     wechat_sessions[user_id] = {"step": "START_DATE", "retries": 0, "data": {}}
-                    utils.send_text(user_id, "收到指令。请回复您需要查询的「开始日期」(支持格式如 2026/02/12, 2026-02-12, 或 20260212)。若不需要指定开始日期(查询当天)，请回复「无」或「跳过」:")
+                    await utils.asend_text(user_id, "收到指令。请回复您需要查询的「开始日期」(支持格式如 2026/02/12, 2026-02-12, 或 20260212)。若不需要指定开始日期(查询当天)，请回复「无」或「跳过」:")
                 else:
-                    utils.send_text(user_id, "⚠️ 未在巡检向导中。请向我发送「巡检」、「开始巡检」或「run」中的任意一个指令以启动交互向导。")
+                    await utils.asend_text(user_id, "⚠️ 未在巡检向导中。请向我发送「巡检」、「开始巡检」或「run」中的任意一个指令以启动交互向导。")
         
     return "success"
 
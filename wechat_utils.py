@@ -1,7 +1,8 @@
-import requests
 import json
 import time
 import os
+import threading
+from im_http import build_session, timeouts, to_async
 
 class WeChatUtils:
     def __init__(self, config):
@@ -11,14 +12,23 @@ class WeChatUtils:
         self.agentid = self.config.get("agentid")
         self.access_token = None
         self.token_expiry = 0
+        # 连接池复用 keep-alive 连接；多个线程同时发现 token 过期时只刷新一次
+        self.session = build_session(config)
+        self.timeout, self.upload_timeout = timeouts(config)
+        self._token_lock = threading.Lock()
 
     def get_access_token(self):
         """获取或刷新 Access Token"""
         if self.access_token and time.time() < self.token_expiry:
             return self.access_token
+        with self._token_lock:
+            if self.access_token and time.time() < self.token_expiry:
+                return self.access_token
+            return self._refresh_token()
 
+    def _refresh_token(self):
         url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={self.corpid}&corpsecret={self.corpsecret}"
-        resp = requests.get(url).json()
+        resp = self.session.get(url, timeout=self.timeout).json()
         if resp.get("errcode") == 0:
             self.access_token = resp.get("access_token")
             # 提前 5 分钟刷新
@@ -38,7 +48,7 @@ class WeChatUtils:
         file_name = os.path.basename(file_path)
         with open(file_path, 'rb') as f:
             files = {'file': (file_name, f)}
-            resp = requests.post(url, files=files).json()
+            resp = self.session.post(url, files=files, timeout=self.upload_timeout).json()
             
         if resp.get("errcode") == 0:
             return resp.get("media_id")
@@ -62,7 +72,7 @@ class WeChatUtils:
             },
             "safe": 0
         }
-        resp = requests.post(url, json=data).json()
+        resp = self.session.post(url, json=data, timeout=self.timeout).json()
         if resp.get("errcode") == 0:
             return True
         else:
@@ -85,7 +95,7 @@ class WeChatUtils:
             },
             "safe": 0
         }
-        resp = requests.post(url, json=data).json()
+        resp = self.session.post(url, json=data, timeout=self.timeout).json()
         return resp.get("errcode") == 0
 
     def send_markdown(self, user_id, content):
@@ -105,10 +115,16 @@ class WeChatUtils:
             "safe": 0
         }
         try:
-            resp = requests.post(url, json=data).json()
+            resp = self.session.post(url, json=data, timeout=self.timeout).json()
             if resp.get("errcode") != 0:
                 print(f"❌ 企微发送 Markdown 失败: {resp}")
             return resp.get("errcode") == 0
         except Exception as e:
             print(f"❌ 企微发送 Markdown 异常: {e}")
             return False
+
+    # 异步版本：供 FastAPI 的 async 处理函数 await，同步接口保持不变
+    aupload_file = to_async(upload_file)
+    asend_file = to_async(send_file)
+    asend_text = to_async(send_text)
+    asend_markdown = to_async(send_markdown)